@@ -2,19 +2,39 @@
 # Imports
 # ----------------------------------------------------------------------------#
 
+import csv
+import hashlib
 import json
 import sys
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from itertools import groupby
 
 import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort
+import babel.dates
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify, \
+    make_response, session, stream_with_context
+from werkzeug.http import is_resource_modified
 from flask_moment import Moment
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 from flask_migrate import Migrate
-from models import Venue, Artist, Show, Genre, db
+from sqlalchemy.exc import IntegrityError
+from models import Venue, Artist, Show, ShowCount, db, collection_version, genre_resolver, DEFAULT_SHOW_MINUTES
+from search import NameSearch
+from cache import ViewCache, venue_key, artist_key
+from facets import FACETED, browse_filters
+from feed import RecentListings
+from importer import import_command
+from retire import retire_command
+from rollups import rollup_command, record_shows, forget_venue
+from explain import explain_check_command
+from partitions import partitions_command
+from booking import booking_index, check_batch
+from instrumentation import SQLInstrumentation
+from routing import read_only
 
 # ----------------------------------------------------------------------------#
 # App Config.
@@ -25,6 +45,15 @@ moment = Moment(app)
 app.config.from_object("config")
 db.init_app(app)
 migrate = Migrate(app, db)
+name_search = NameSearch(app)
+view_cache = ViewCache(app)
+recent_listings = RecentListings(app)
+SQLInstrumentation(app)
+app.cli.add_command(import_command)
+app.cli.add_command(retire_command)
+app.cli.add_command(rollup_command)
+app.cli.add_command(explain_check_command)
+app.cli.add_command(partitions_command)
 
 # TODO: connect to a local postgresql database
 
@@ -38,26 +67,97 @@ migrate = Migrate(app, db)
 # ----------------------------------------------------------------------------#
 
 
-def format_datetime(value, format="medium"):
-    date = dateutil.parser.parse(value)
-    if format == "full":
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == "medium":
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format, locale="en")
+DATETIME_FORMATS = {
+    "full": "EEEE MMMM, d, y 'at' h:mma",
+    "medium": "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=64)
+def datetime_pattern(format, locale):
+    # compiled babel pattern and parsed locale, built once per combination
+    return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)), babel.Locale.parse(locale)
+
+
+def format_datetime(value, format="medium", locale="en"):
+    if isinstance(value, str):
+        value = dateutil.parser.parse(value)
+    if value.tzinfo is None:
+        # babel reads naive datetimes as UTC
+        value = value.replace(tzinfo=babel.dates.UTC)
+    pattern, locale = datetime_pattern(format, locale)
+    return pattern.apply(value, locale)
 
 
 app.jinja_env.filters["datetime"] = format_datetime
 
+# ----------------------------------------------------------------------------#
+# Cache keys.
+# ----------------------------------------------------------------------------#
+
+
+def venue_cache_keys(venue_id):
+    # a venue's page plus the pages of artists listing its name on their shows
+    artist_ids = db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()
+    return [venue_key(venue_id)] + [artist_key(row.artist_id) for row in artist_ids]
+
+
+def artist_cache_keys(artist_id):
+    venue_ids = db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()
+    return [artist_key(artist_id)] + [venue_key(row.venue_id) for row in venue_ids]
+
+
+# ----------------------------------------------------------------------------#
+# Conditional requests.
+# ----------------------------------------------------------------------------#
+
+
+def conditional(version, render):
+    # answers If-None-Match/If-Modified-Since with a 304 before render() runs.
+    # version is (last_modified, ...) from the models' version queries
+    etag, last_modified, fresh = validators(version)
+    return validated(Response(status=304) if fresh else make_response(render()), etag, last_modified)
+
+
+def validators(version):
+    # (etag, last_modified, whether the client's copy is still current)
+    last_modified = version[0]
+    etag = hashlib.sha1(f"{request.full_path}|{version!r}".encode()).hexdigest()
+    # pending flash messages are part of the page, so never skip rendering them
+    fresh = "_flashes" not in session and not is_resource_modified(request.environ, etag=etag,
+                                                                   last_modified=last_modified)
+    return etag, last_modified, fresh
+
+
+def validated(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    return response
+
+
 # ----------------------------------------------------------------------------#
 # Controllers.
 # ----------------------------------------------------------------------------#
 
+# The read views build their queries and shape the rows in separate
+# functions (*_query / *_page / *_data), which asgi.py shares to serve the
+# same pages from an asyncio engine.
+
 
 @app.route("/")
+@read_only
 def index():
-    recently_listed_venue = Venue.query.order_by(Venue.id.desc()).limit(10).all()
-    recently_listed_artist = Artist.query.order_by(Artist.id.desc()).limit(10).all()
+    return render_index()
+
+
+def render_index():
+    # served from the in-memory feed, see feed.py
+    venues, artists = recent_listings.listings()
+    return conditional(recent_listings.version(venues, artists), lambda: home_page(venues, artists))
+
+
+def home_page(recently_listed_venue, recently_listed_artist):
     return render_template("pages/home.html", new_artists=recently_listed_artist, new_venues=recently_listed_venue)
 
 
@@ -66,103 +166,121 @@ def index():
 
 
 @app.route("/venues")
+@read_only
 def venues():
     # TODO: replace with real venues data.
     # num_upcoming_shows should be aggregated based on number of upcoming
     # shows per venue.
+    return conditional(collection_version(Venue, Show, ShowCount), render_venues)
+
+
+def render_venues():
+    return venues_page(Venue.area_listing())
+
+
+def venues_page(listing):
     form = SearchByCityForm()
-    areas = db.session.query(Venue.city, Venue.state).group_by(Venue.city, Venue.state).order_by(Venue.state.asc()).all()
     data = []
-    for area in areas:
-        location = {"city": area.city, "state": area.state}
-        venue_list = []
-        for venue in Venue.query.filter(Venue.city == area.city, Venue.state == area.state).all():
-            venue_detail = {
-                "id": venue.id,
-                "name": venue.name,
-                "num_upcoming_shows": venue.upcoming_show_count(),
-            }
-            venue_list.append(venue_detail)
-        location["venues"] = venue_list
-        data.append(location)
+    for (city, state), rows in groupby(listing, key=lambda row: (row.city, row.state)):
+        venue_list = [
+            {"id": row.id, "name": row.name, "num_upcoming_shows": row.num_upcoming_shows,
+             "updated_at": row.updated_at} for row in rows
+        ]
+        data.append({"city": city, "state": state, "venues": venue_list})
     return render_template("pages/venues.html", areas=data, form=form)
 
 
 @app.route("/venues/search", methods=["POST"])
+@read_only
 def search_venues():
     # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
     # search for Hop should return "The Musical Hop".
     # search for "Music" should return "The Musical Hop" and "Park Square Live
     # Music & Coffee"
     search_term = request.form.get("search_term", "")
-    query = Venue.query.filter(Venue.name.ilike(f"%{search_term}%")).all()
-    query_count = Venue.query.filter(Venue.name.ilike(f"%{search_term}%")).count()
-    response = {
-        'count': query_count,
-        "data": [
-            {"id": item.id, "name": item.name} for item in query
-        ]
-    }
+    response = name_search.search(Venue, search_term)
+    return search_page("pages/search_venues.html", response, search_term)
+
+
+def search_page(template, response, search_term):
     return render_template(
-        "pages/search_venues.html",
+        template,
         results=response,
         search_term=search_term,
     )
 
 
 @app.route("/venues/search_by_city", methods=["POST"])
+@read_only
 def search_venue_by_city():
     form = SearchByCityForm(request.form)
     city = form.city.data
     state = form.state.data
     search_term = f"{city}, {state}"
-    query = Venue.query.filter(Venue.city == city, Venue.state == state).all()
-    query_count = Venue.query.filter(Venue.city == city, Venue.state == state).count()
-    response = {
-        "count": query_count,
+    rows = city_search_query(Venue, city, state).all()
+    return search_page("pages/search_venues.html", city_search_response(rows), search_term)
+
+
+def city_search_query(model, city, state):
+    return db.session.query(model.id, model.name).filter(model.city == city, model.state == state)
+
+
+def city_search_response(rows):
+    return {
+        "count": len(rows),
         "data": [
-            {"id": item.id, "name": item.name} for item in query
+            {"id": item.id, "name": item.name} for item in rows
         ]
     }
-    return render_template(
-        "pages/search_venues.html",
-        results=response,
-        search_term=search_term,
-    )
 
 
-@app.route("/venues/<int:venue_id>")
-def show_venue(venue_id):
-    # shows the venue page with the given venue_id
-    # TODO: replace with real venue data from the venues table, using venue_id
+def venue_detail(venue_id):
+    # builds the show_venue view model, None if the venue doesn't exist
     venue = Venue.query.get(venue_id)
     if not venue:
-        abort(404)
+        return None
+    return venue_detail_data(venue, *venue.show_schedule())
+
 
-    data = {"id": venue.id, "name": venue.name, "genres": [genre.name for genre in venue.genres],
+def venue_detail_data(venue, upcoming_shows, past_shows):
+    data = {"id": venue.id, "name": venue.name, "genres": genre_resolver.names(venue.genre_ids),
             "address": venue.address, "city": venue.city,
             "state": venue.state, "phone": venue.phone, "website": venue.website_link,
             "facebook_link": venue.facebook_link, "seeking_talent": venue.seeking_talent,
             "seeking_description": venue.seeking_description, "image_link": venue.image_link,
-            "past_shows": [], "past_shows_count": venue.past_shows_count(),
-            "upcoming_shows_count": venue.upcoming_show_count(), "upcoming_shows": []}
-    for show in venue.upcoming_shows():
-        artist = {
-            "artist_id": show.artist_id,
-            "artist_name": show.artist.name,
-            "artist_image_link": show.artist.image_link,
-            "start_time": show.start_time.strftime("%Y-%m-%dT%H:%M:%S.000Z")
-        }
-        data["upcoming_shows"].append(artist)
-
-    for show in venue.past_shows():
-        artist = {
-            "artist_id": show.artist_id,
-            "artist_name": show.artist.name,
-            "artist_image_link": show.artist.image_link,
-            "start_time": show.start_time.strftime("%Y-%m-%dT%H:%M:%S.000Z")
-        }
-        data["past_shows"].append(artist)
+            "past_shows": [venue_show_detail(show) for show in past_shows], "past_shows_count": len(past_shows),
+            "upcoming_shows_count": len(upcoming_shows),
+            "upcoming_shows": [venue_show_detail(show) for show in upcoming_shows]}
+    return data
+
+
+def venue_show_detail(show):
+    return {
+        "artist_id": show.artist_id,
+        "artist_name": show.artist_name,
+        "artist_image_link": show.artist_image_link,
+        "start_time": show.start_time
+    }
+
+
+@app.route("/venues/<int:venue_id>")
+@read_only
+def show_venue(venue_id):
+    # shows the venue page with the given venue_id
+    version = Venue.page_version(venue_id)
+    if version is None:
+        abort(404)
+    return conditional(version, lambda: render_venue(venue_id, version))
+
+
+def render_venue(venue_id, version):
+    data = view_cache.get_or_set(venue_key(venue_id), lambda: venue_detail(venue_id), version)
+    return venue_page(data)
+
+
+def venue_page(data):
+    if data is None:
+        abort(404)
     return render_template("pages/show_venue.html", venue=data)
 
 
@@ -196,16 +314,7 @@ def create_venue_submission():
             address=form.address.data
         )
 
-        genres = []
-        for genre_name in form.genres.data:
-            genre_instance = Genre.query.filter_by(name=genre_name).first()
-            if genre_instance:
-                genres.append(genre_instance)
-            else:
-                new_genre = Genre(name=genre_name)
-                genres.append(new_genre)
-
-        new_venue.genres.extend(genres)
+        new_venue.genres = genre_resolver.genres(form.genres.data)
         db.session.add(new_venue)
         db.session.commit()
     except:
@@ -214,6 +323,8 @@ def create_venue_submission():
         flash(f"An error occurred while creating new venue. Venue {form.name.data} couldn't be listed.")
     else:
         flash(f"Venue { form.name.data } was successfully listed!")
+        name_search.index(new_venue)
+        recent_listings.add(new_venue)
         db.session.close()
     # on successful db insert, flash success
 
@@ -231,7 +342,9 @@ def delete_venue(venue_id):
     venue = Venue.query.get(venue_id)
     if not venue:
         abort(404)
+    stale_keys = venue_cache_keys(venue_id)
     try:
+        forget_venue(venue_id)
         db.session.delete(venue)
         db.session.commit()
     except:
@@ -239,7 +352,11 @@ def delete_venue(venue_id):
         db.session.rollback()
         flash(f"An error occurred while trying to unlist Venue {venue.id}")
     else:
-        flash(f"You have successfully unlisted Venue {venue.id}")
+        flash(f"You have successfully unlisted Venue {venue_id}")
+        name_search.discard(Venue, venue_id)
+        recent_listings.discard(Venue, venue_id)
+        booking_index.forget_venue(venue_id)
+        view_cache.delete(*stale_keys)
     finally:
         db.session.close()
 
@@ -252,86 +369,95 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route("/artists")
+@read_only
 def artists():
     # TODO: replace with real data returned from querying the database
+    return conditional(collection_version(Artist), render_artists)
+
+
+def render_artists():
+    return artists_page(artist_listing_query().all())
+
+
+def artist_listing_query():
+    return db.session.query(Artist.id, Artist.name, Artist.updated_at)
+
+
+def artists_page(data):
     form = SearchByCityForm()
-    data = db.session.query(Artist.id, Artist.name).all()
     return render_template("pages/artists.html", artists=data, form=form)
 
 
 @app.route("/artists/search", methods=["POST"])
+@read_only
 def search_artists():
     # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
     # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
     # search for "band" should return "The Wild Sax Band".
     search_term = request.form.get("search_term", "")
-    query = Artist.query.filter(Artist.name.ilike(f"%{search_term}%")).all()
-    count = Artist.query.filter(Artist.name.ilike(f"%{search_term}%")).count()
-    response = {
-        "count": count,
-        "data": [{"id": item.id, "name": item.name} for item in query]
-    }
-
-    return render_template(
-        "pages/search_artists.html",
-        results=response,
-        search_term=search_term,
-    )
+    response = name_search.search(Artist, search_term)
+    return search_page("pages/search_artists.html", response, search_term)
 
 
 @app.route("/artists/search_by_city", methods=["POST"])
+@read_only
 def search_artist_by_city():
     form = SearchByCityForm(request.form)
     state = form.state.data
     city = form.city.data
-    print(state)
-    print(city)
-    query = Artist.query.filter(Artist.city == city, Artist.state == state).all()
-    query_count = Artist.query.filter(Artist.city == city, Artist.state == state).count()
     search_term = f"{city}, {state}"
-    response = {
-        'count': query_count,
-        "data": [
-            {"id": item.id, "name": item.name} for item in query
-        ]
-    }
-    return render_template(
-        "pages/search_venues.html",
-        results=response,
-        search_term=search_term,
-    )
+    rows = city_search_query(Artist, city, state).all()
+    return search_page("pages/search_venues.html", city_search_response(rows), search_term)
 
 
-@app.route("/artists/<int:artist_id>")
-def show_artist(artist_id):
-    # shows the artist page with the given artist_id
-    # TODO: replace with real artist data from the artist table, using
-    # artist_id
+def artist_detail(artist_id):
+    # builds the show_artist view model, None if the artist doesn't exist
     artist = Artist.query.get(artist_id)
+    if not artist:
+        return None
+    return artist_detail_data(artist, *artist.show_schedule())
+
+
+def artist_detail_data(artist, upcoming_shows, past_shows):
     data = {"id": artist.id, "name": artist.name, "city": artist.city, "state": artist.state,
             "phone": artist.phone, "website": artist.website_link, "facebook_link": artist.facebook_link,
             "seeking_venue": artist.seeking_venue, "seeking_description": artist.seeking_description,
-            "image_link": artist.image_link, "genres": [genre.name for genre in artist.genres], "past_shows": [],
-            "upcoming_shows": [], "past_shows_count": artist.past_shows_count(),
-            "upcoming_shows_count": artist.upcoming_shows_count(), "time_available_from" : artist.time_available_from,
+            "image_link": artist.image_link, "genres": genre_resolver.names(artist.genre_ids),
+            "past_shows": [artist_show_detail(show) for show in past_shows],
+            "upcoming_shows": [artist_show_detail(show) for show in upcoming_shows],
+            "past_shows_count": len(past_shows),
+            "upcoming_shows_count": len(upcoming_shows), "time_available_from" : artist.time_available_from,
             "time_available_to":artist.time_available_to}
-    for show in artist.past_shows():
-        show_detail = {
-            "venue_id": show.venue_id,
-            "venue_name": show.venue.name,
-            "venue_image_link": show.venue.image_link,
-            "start_time": show.start_time.strftime("%Y-%m-%dT%H:%M:%S.000Z")
-        }
-        data["past_shows"].append(show_detail)
-
-    for show in artist.upcoming_shows():
-        show_detail = {
-            "venue_id": show.venue_id,
-            "venue_name": show.venue.name,
-            "venue_image_link": show.venue.image_link,
-            "start_time": show.start_time.strftime("%Y-%m-%dT%H:%M:%S.000Z")
-        }
-        data["upcoming_shows"].append(show_detail)
+    return data
+
+
+def artist_show_detail(show):
+    return {
+        "venue_id": show.venue_id,
+        "venue_name": show.venue_name,
+        "venue_image_link": show.venue_image_link,
+        "start_time": show.start_time
+    }
+
+
+@app.route("/artists/<int:artist_id>")
+@read_only
+def show_artist(artist_id):
+    # shows the artist page with the given artist_id
+    version = Artist.page_version(artist_id)
+    if version is None:
+        abort(404)
+    return conditional(version, lambda: render_artist(artist_id, version))
+
+
+def render_artist(artist_id, version):
+    data = view_cache.get_or_set(artist_key(artist_id), lambda: artist_detail(artist_id), version)
+    return artist_page(data)
+
+
+def artist_page(data):
+    if data is None:
+        abort(404)
     return render_template("pages/show_artist.html", artist=data)
 
 
@@ -352,6 +478,9 @@ def edit_artist_submission(artist_id):
     if not artist:
         abort(404)
     try:
+        # resolved before the artist is modified: new genres are committed on
+        # a separate connection
+        genres = genre_resolver.genres(form.genres.data)
         artist.name = form.name.data
         artist.city = form.city.data
         artist.state = form.state.data
@@ -363,22 +492,17 @@ def edit_artist_submission(artist_id):
         artist.seeking_description = form.seeking_description.data
         artist.time_available_from = form.time_available_from.data
         artist.time_available_to = form.time_available_to.data
-        if form.genres.data:
-            genres = []
-            for genre in form.genres.data:
-                genre_instance = Genre.query.filter_by(name=genre).first()
-                if genre_instance:
-                    genres.append(genre_instance)
-                else:
-                    new_genre_instance = Genre(name=genre)
-                    db.session.add(new_genre_instance)
-                    genres.append(new_genre_instance)
+        if genres:
             artist.genres = genres
 
         db.session.commit()
     except:
         print(sys.exc_info())
         db.session.rollback()
+    else:
+        name_search.index(artist)
+        recent_listings.update(artist)
+        view_cache.delete(*artist_cache_keys(artist_id))
     finally:
         db.session.close()
 
@@ -402,32 +526,27 @@ def edit_venue_submission(venue_id):
     if not venue:
         abort(404)
     try:
+        genres = genre_resolver.genres(form.genres.data)
         venue.name = form.name.data
         venue.state = form.state.data
         venue.city = form.city.data
         venue.address = form.address.data
-        venue.phone = form.phone.address.data
+        venue.phone = form.phone.data
         venue.website_link = form.website_link.data
         venue.facebook_link = form.facebook_link.data
         venue.seeking_talent = form.seeking_talent.data
         venue.seeking_description = form.seeking_description.data
         venue.image_link = form.image_link.data
-
-        genres = []
-        for genre in form.genres.data:
-            genre_instance = Genre.query.filter_by(name=genre).first()
-            if genre_instance:
-                genres.append(genre_instance)
-            else:
-                new_genre_instance = Genre(name=genre)
-                genre.append(new_genre_instance)
-
         venue.genres = genres
         db.session.commit()
 
     except:
         print(sys.exc_info())
         db.session.rollback()
+    else:
+        name_search.index(venue)
+        recent_listings.update(venue)
+        view_cache.delete(*venue_cache_keys(venue_id))
     finally:
         db.session.close()
 
@@ -465,18 +584,9 @@ def create_artist_submission():
             seeking_venue=form.seeking_venue.data,
             seeking_description=form.seeking_description.data,
             time_available_to=form.time_available_to.data,
-            time_availbale_from=form.time_available_from.data,
+            time_available_from=form.time_available_from.data,
         )
-        genres = []
-        for genre_name in form.genres.data:
-            genre_instance = Genre.query.filter_by(name=genre_name).first()
-            if genre_instance:
-                genres.append(genre_instance)
-            else:
-                new_genre = Genre(name=genre_name)
-                genres.append(new_genre)
-
-        new_artist.genres.extend(genres)
+        new_artist.genres = genre_resolver.genres(form.genres.data)
         db.session.add(new_artist)
         db.session.commit()
 
@@ -486,6 +596,8 @@ def create_artist_submission():
     else:
         # on successful db insert, flash success
         flash("Artist " + request.form["name"] + " was successfully listed!")
+        name_search.index(new_artist)
+        recent_listings.add(new_artist)
     finally:
         db.session.close()
     # TODO: on unsuccessful db insert, flash an error instead.
@@ -498,25 +610,94 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 
+SHOWS_PER_PAGE = 30
+SHOW_WINDOWS = ("upcoming", "month", "past", "all")
+
+
+def show_window(window, now):
+    # returns (start, end, descending) bounds for a named /shows window
+    if window == "upcoming":
+        return now, None, False
+    if window == "month":
+        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        if month_start.month == 12:
+            month_end = month_start.replace(year=month_start.year + 1, month=1)
+        else:
+            month_end = month_start.replace(month=month_start.month + 1)
+        return month_start, month_end, False
+    if window == "past":
+        return None, now, True
+    return None, None, False
+
+
+def encode_cursor(start_time, show_id):
+    return f"{start_time.isoformat()}_{show_id}"
+
+
+def decode_cursor(cursor):
+    try:
+        start_time, show_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(start_time), int(show_id)
+    except ValueError:
+        abort(400)
+
+
 @app.route("/shows")
+@read_only
 def shows():
-    # displays list of shows at /shows
-    # TODO: replace with real venues data.
+    # displays list of shows at /shows, one keyset page at a time
+    window, after = shows_arguments()
+    version = shows_version(collection_version(Show, Venue, Artist), window)
+    return conditional(version, lambda: render_shows(window, after))
+
+
+def shows_arguments():
+    # (window, cursor key) from the query string
+    window = request.args.get("window", "upcoming")
+    if window not in SHOW_WINDOWS:
+        abort(400)
+    cursor = request.args.get("after")
+    return window, decode_cursor(cursor) if cursor else None
+
+
+def shows_version(version, window):
+    if window == "month":
+        # the month window moves on even when no show does
+        version += (datetime.now().strftime("%Y-%m"),)
+    return version
+
+
+def render_shows(window, after):
+    return shows_page(shows_query(window, after).all(), window)
+
+
+def shows_query(window, after):
+    # one row more than a page, to tell whether there is a next page
+    start, end, descending = show_window(window, datetime.now())
+    return Show.listing_query(start, end, after, descending, versioned=True).limit(SHOWS_PER_PAGE + 1)
+
+
+def shows_page(rows, window):
+    next_cursor = None
+    if len(rows) > SHOWS_PER_PAGE:
+        rows = rows[:SHOWS_PER_PAGE]
+        next_cursor = encode_cursor(rows[-1].start_time, rows[-1].id)
+
     data = []
-    # first = Show.query.first()
-    # string = first.start_time.strftime("%Y-%m-%dT%H:%M:%S.000Z")
-    # print(string)
-    for show in Show.query.all():
+    for row in rows:
         show_info = {
-            "venue_id": show.venue_id,
-            "venue_name": show.venue.name,
-            "artist_id" : show.artist_id,
-            "artist_name": show.artist.name,
-            "artist_image_link": show.artist.image_link,
-            "start_time": show.start_time.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+            "venue_id": row.venue_id,
+            "venue_name": row.venue_name,
+            "artist_id": row.artist_id,
+            "artist_name": row.artist_name,
+            "artist_image_link": row.artist_image_link,
+            "start_time": row.start_time,
+            "id": row.id,
+            "version": (row.updated_at, row.venue_updated_at, row.artist_updated_at)
         }
         data.append(show_info)
-    return render_template("pages/shows.html", shows=data)
+    return render_template("pages/shows.html", shows=data, window=window, windows=SHOW_WINDOWS,
+                           next_cursor=next_cursor)
 
 
 @app.route("/shows/create")
@@ -526,28 +707,57 @@ def create_shows():
     return render_template("forms/new_show.html", form=form)
 
 
+# SQLSTATE raised by Postgres when an exclusion constraint rejects a row
+EXCLUSION_VIOLATION = "23P01"
+
+
 @app.route("/shows/create", methods=["POST"])
 def create_show_submission():
     # called to create new shows in the db, upon submitting new show listing form
     # TODO: insert form data as a new Show record in the db, instead
     form = ShowForm(request.form)
+    # field by field: the templates render no CSRF token for form.validate()
+    invalid = [field for field in (form.start_time, form.duration) if not field.validate(form)]
+    if invalid:
+        flash(" ".join(f"Invalid {field.name}: {' '.join(field.errors)}" for field in invalid))
+        return redirect(url_for("create_shows"))
+
     artist = Artist.query.get(form.artist_id.data)
     time = form.start_time.data.time()
     if not artist:
         abort(404)
 
-    if artist.time_available_from > time or artist.time_available_to <= time:
+    if not artist.is_available_at(time):
         flash(f"Artist {artist.name} will not be available for the show")
         return redirect(url_for("create_shows"))
 
+    start_time = form.start_time.data
+    end_time = start_time + timedelta(minutes=form.duration.data)
+    conflicts = booking_index.conflicts(int(form.venue_id.data), artist.id, start_time, end_time)
+    if conflicts:
+        flash(" ".join(f"The {entity_type} is already booked for show {show_id} at that time."
+                       for entity_type, show_id in conflicts))
+        return redirect(url_for("create_shows"))
+
     try:
         new_show = Show(
             artist_id=form.artist_id.data,
             venue_id=form.venue_id.data,
-            start_time=form.start_time.data
+            start_time=start_time,
+            end_time=end_time
         )
         db.session.add(new_show)
+        record_shows([(int(form.venue_id.data), int(form.artist_id.data), start_time)])
         db.session.commit()
+    except IntegrityError as error:
+        db.session.rollback()
+        if getattr(error.orig, "pgcode", None) != EXCLUSION_VIOLATION:
+            print(sys.exc_info())
+            flash("An error occurred. Show couldn't be listed.")
+        else:
+            # the exclusion constraint caught a booking made by another worker
+            booking_index.clear()
+            flash("The artist or venue is already booked at that time. Show couldn't be listed.")
     except:
         print(sys.exc_info())
         db.session.rollback()
@@ -555,12 +765,243 @@ def create_show_submission():
     # on successful db insert, flash success
     else:
         flash("Show was successfully listed!")
+        booking_index.add(new_show.venue_id, new_show.artist_id, start_time, end_time, new_show.id)
+        view_cache.delete(artist_key(new_show.artist_id), venue_key(new_show.venue_id))
     # TODO: on unsuccessful db insert, flash an error instead.
     # e.g., flash('An error occurred. Show could not be listed.')
     # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
     return render_template("pages/home.html")
 
 
+MAX_BATCH_SHOWS = 500
+BATCH_FIELDS = ("artist_id", "venue_id", "start_time", "duration")
+
+
+def parse_booking(entry):
+    # (artist_id, venue_id, start, end) from one batch row; ValueError with
+    # a readable message when a field is malformed
+    try:
+        artist_id, venue_id = int(entry.get("artist_id")), int(entry.get("venue_id"))
+    except (TypeError, ValueError):
+        raise ValueError("artist_id and venue_id must be integers")
+    try:
+        start = datetime.fromisoformat(str(entry.get("start_time")).strip())
+    except ValueError:
+        raise ValueError(f"start_time must be a date and time, got {entry.get('start_time')!r}")
+    duration = entry.get("duration") or DEFAULT_SHOW_MINUTES
+    try:
+        end = start + timedelta(minutes=int(duration))
+    except (TypeError, ValueError):
+        raise ValueError(f"duration must be a number of minutes, got {duration!r}")
+    return artist_id, venue_id, start, end
+
+
+def schedule_batch(entries):
+    # books every valid entry in one transaction; returns one result dict
+    # per entry, in order
+    results = [{"row": row} for row in range(1, len(entries) + 1)]
+    accepted = []
+    for result, entry in zip(results, entries):
+        try:
+            accepted.append((result, parse_booking(entry)))
+        except ValueError as error:
+            result.update(status="rejected", error=str(error))
+    errors = check_batch([booking for _, booking in accepted])
+    for (result, _), error in zip(accepted, errors):
+        if error is not None:
+            result.update(status="rejected", error=error)
+    accepted = [(result, booking) for result, booking in accepted if "error" not in result]
+    if not accepted:
+        return results
+
+    try:
+        new_shows = [Show(artist_id=artist_id, venue_id=venue_id, start_time=start, end_time=end)
+                     for _, (artist_id, venue_id, start, end) in accepted]
+        db.session.add_all(new_shows)
+        record_shows([(venue_id, artist_id, start) for _, (artist_id, venue_id, start, _) in accepted])
+        db.session.commit()
+    except IntegrityError as error:
+        db.session.rollback()
+        if getattr(error.orig, "pgcode", None) == EXCLUSION_VIOLATION:
+            booking_index.clear()
+        for result, _ in accepted:
+            result.update(status="rejected", error="the batch was rejected by the database, nothing was booked")
+        return results
+    stale_keys = set()
+    for (result, _), show in zip(accepted, new_shows):
+        result.update(status="created", show_id=show.id)
+        booking_index.add(show.venue_id, show.artist_id, show.start_time, show.end_time, show.id)
+        stale_keys.update((artist_key(show.artist_id), venue_key(show.venue_id)))
+    view_cache.delete(*stale_keys)
+    return results
+
+
+@app.route("/shows/batch")
+def create_show_batch():
+    form = ShowBatchForm()
+    return render_template("forms/new_shows.html", form=form, results=None)
+
+
+@app.route("/shows/batch", methods=["POST"])
+def create_show_batch_submission():
+    # books many shows at once, from the form's CSV lines or a JSON body
+    # {"shows": [{"artist_id": .., "venue_id": .., "start_time": .., "duration": ..}]}
+    if request.is_json:
+        entries = (request.get_json(silent=True) or {}).get("shows")
+        if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+            abort(400)
+    else:
+        form = ShowBatchForm(request.form)
+        lines = [line for line in (form.shows.data or "").splitlines() if line.strip()]
+        entries = [dict(zip(BATCH_FIELDS, (field.strip() for field in fields))) for fields in csv.reader(lines)]
+    if len(entries) > MAX_BATCH_SHOWS:
+        abort(413)
+
+    results = schedule_batch(entries)
+    if request.is_json:
+        created = sum(result["status"] == "created" for result in results)
+        return jsonify(results=results), 201 if created else 422
+    return render_template("forms/new_shows.html", form=form, results=results)
+
+
+#  Autocomplete
+#  ----------------------------------------------------------------
+
+AUTOCOMPLETE_TYPES = {"venue": Venue, "artist": Artist}
+
+
+@app.route("/autocomplete")
+@read_only
+def autocomplete():
+    # ?q=<prefix>[&type=venue|artist][&limit=n], answered from memory
+    prefix = request.args.get("q", "")
+    kind = request.args.get("type")
+    if kind is not None and kind not in AUTOCOMPLETE_TYPES:
+        abort(400)
+    limit = request.args.get("limit", type=int)
+    if limit is not None and not 0 < limit <= 50:
+        abort(400)
+    kinds = [kind] if kind else list(AUTOCOMPLETE_TYPES)
+    return jsonify({f"{kind}s": name_search.autocomplete(AUTOCOMPLETE_TYPES[kind], prefix, limit) for kind in kinds})
+
+
+#  API
+#  ----------------------------------------------------------------
+
+API_STREAM_BATCH = 1000
+
+
+def json_default(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def requested_fields(available):
+    # ?fields=id,name selects a subset of the record's keys
+    fields = request.args.get("fields")
+    if not fields:
+        return None
+    fields = [field.strip() for field in fields.split(",") if field.strip()]
+    if set(fields) - set(available):
+        abort(400)
+    return fields
+
+
+def sparse(record, fields):
+    return record if fields is None else {field: record[field] for field in fields}
+
+
+def json_response(record):
+    return Response(json.dumps(sparse(record, requested_fields(record)), default=json_default),
+                    mimetype="application/json")
+
+
+def ndjson_response(query):
+    # streams one JSON object per row from a server-side cursor, so memory
+    # stays flat however many rows the query returns
+    fields = requested_fields([column["name"] for column in query.column_descriptions])
+
+    def generate():
+        for row in query.yield_per(API_STREAM_BATCH):
+            yield json.dumps(sparse(row._asdict(), fields), default=json_default) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@app.route("/api/v1/venues")
+@read_only
+def api_venues():
+    return ndjson_response(Venue.area_listing_query().add_columns(Venue.genre_ids))
+
+
+@app.route("/api/v1/venues/<int:venue_id>")
+@read_only
+def api_venue(venue_id):
+    version = Venue.page_version(venue_id)
+    if version is None:
+        abort(404)
+    return conditional(version, lambda: json_response(
+        view_cache.get_or_set(venue_key(venue_id), lambda: venue_detail(venue_id), version)))
+
+
+@app.route("/api/v1/artists")
+@read_only
+def api_artists():
+    query = db.session.query(Artist.id, Artist.name, Artist.city, Artist.state, Artist.genre_ids) \
+        .order_by(Artist.id.asc())
+    return ndjson_response(query)
+
+
+@app.route("/api/v1/artists/<int:artist_id>")
+@read_only
+def api_artist(artist_id):
+    version = Artist.page_version(artist_id)
+    if version is None:
+        abort(404)
+    return conditional(version, lambda: json_response(
+        view_cache.get_or_set(artist_key(artist_id), lambda: artist_detail(artist_id), version)))
+
+
+@app.route("/api/v1/venues/browse")
+@read_only
+def api_browse_venues():
+    return browse(Venue)
+
+
+@app.route("/api/v1/artists/browse")
+@read_only
+def api_browse_artists():
+    return browse(Artist)
+
+
+def browse(model):
+    # one page of matches plus per-facet counts, see facets.py
+    cursor = request.args.get("after")
+    try:
+        filters = browse_filters(request.args)
+        after = int(cursor) if cursor else None
+    except ValueError:
+        abort(400)
+    version = collection_version(model, Show, ShowCount)
+    return conditional(version, lambda: jsonify(FACETED[model].browse(filters, after)))
+
+
+@app.route("/api/v1/shows")
+@read_only
+def api_shows():
+    window = request.args.get("window", "all")
+    if window not in SHOW_WINDOWS:
+        abort(400)
+    start, end, descending = show_window(window, datetime.now())
+    return ndjson_response(Show.listing_query(start, end, descending=descending))
+
+
+@app.route("/cache/stats")
+def cache_stats():
+    return jsonify(view_cache.stats())
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template("errors/404.html"), 404
@@ -0,0 +1,382 @@
+"""ASGI entry point serving the read routes from an asyncio engine.
+
+    uvicorn asgi:application --workers 4
+
+The venue/artist/show listings, the detail pages and the searches run their
+queries on SQLAlchemy's asyncio engine (asyncpg for Postgres, aiosqlite for
+SQLite), so a worker keeps serving other requests while one waits on the
+database. The home page is served from the in-memory feed in feed.py. The
+queries come from the same builders as the Flask views and their rows go
+through the same shaping and template functions in app.py; only the
+execution is awaited. Work that still blocks - feed and index reloads, genre
+lookups, the n-gram search - runs on the thread pool through ``run_sync``.
+Requests still run inside a Flask request context, so before-first-request
+and before/after request hooks, sessions and error handlers behave as under
+WSGI.
+
+Every other route is handed to the Flask WSGI app on a thread pool, so this
+module can replace the WSGI server outright. Response bodies are sent chunk
+by chunk as the app yields them, so the NDJSON exports stream as they do
+under WSGI. Replicas and client stickiness are honoured as in routing.py.
+
+This pays off when requests wait on a database over the network; against a
+local SQLite file it is no faster than the WSGI app.
+"""
+import asyncio
+import io
+import random
+import sys
+import threading
+import weakref
+from datetime import datetime
+
+from flask import request
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from werkzeug.exceptions import HTTPException
+
+from app import app, name_search, view_cache, validators, validated, render_index, \
+    venues_page, artist_listing_query, artists_page, search_page, city_search_query, city_search_response, \
+    venue_detail_data, venue_page, artist_detail_data, artist_page, shows_arguments, shows_version, \
+    shows_query, shows_page
+from cache import venue_key, artist_key
+from forms import SearchByCityForm
+from models import db, Venue, Artist, Show, ShowCount, collection_version_query, split_shows, version_of
+from routing import replica_keys, is_sticky
+from search import TrigramSearch
+
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+# body chunks a WSGI response may run ahead of a slow client
+STREAM_QUEUE_SIZE = 8
+_DONE = object()
+
+
+def async_url(url):
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise RuntimeError(f"no asyncio driver configured for {url.get_backend_name()}")
+    return url.set(drivername=driver)
+
+
+class AsyncDatabase:
+    """Asyncio engines for the primary and the replicas, one set per event loop."""
+
+    def __init__(self, app):
+        self.app = app
+        self.engines = weakref.WeakKeyDictionary()
+
+    def _create(self, url):
+        options = {key: value for key, value in self.app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}).items()
+                   if key != "connect_args"}
+        url = async_url(url)
+        timeout = self.app.config.get("DB_STATEMENT_TIMEOUT")
+        if timeout and url.get_backend_name() == "postgresql":
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(timeout)}}
+        return create_async_engine(url, **options)
+
+    def engine(self, bind=None):
+        engines = self.engines.setdefault(asyncio.get_running_loop(), {})
+        engine = engines.get(bind)
+        if engine is None:
+            url = self.app.config["SQLALCHEMY_BINDS"][bind] if bind else self.app.config["SQLALCHEMY_DATABASE_URI"]
+            engine = engines[bind] = self._create(url)
+        return engine
+
+    def session(self):
+        # a replica unless the client wrote recently; call in a request context
+        keys = replica_keys(self.app)
+        bind = random.choice(keys) if keys and not is_sticky() else None
+        return AsyncSession(self.engine(bind), expire_on_commit=False)
+
+    async def dispose(self):
+        for engine in self.engines.pop(asyncio.get_running_loop(), {}).values():
+            await engine.dispose()
+
+
+database = AsyncDatabase(app)
+
+
+async def fetch_all(session, query):
+    return (await session.execute(query.statement)).all()
+
+
+async def fetch_first(session, query):
+    return (await session.execute(query.statement)).first()
+
+
+async def fetch_entities(session, query):
+    return (await session.execute(query.statement)).unique().scalars().all()
+
+
+async def run_sync(function, *args):
+    # blocking work on the thread pool, inside a copy of the request context;
+    # the worker thread's scoped session is closed before it is reused
+    def call():
+        try:
+            return function(*args)
+        finally:
+            db.session.remove()
+    return await asyncio.to_thread(call)
+
+
+async def conditional(version, render):
+    # app.conditional for a coroutine function render
+    etag, last_modified, fresh = validators(version)
+    response = app.response_class(status=304) if fresh else app.make_response(await render())
+    return validated(response, etag, last_modified)
+
+
+#  Views
+#  ----------------------------------------------------------------
+
+
+async def index(session):
+    # the feed needs no queries once loaded; its reloads run on the sync session
+    return await run_sync(render_index)
+
+
+async def venues(session):
+    version = version_of(await fetch_first(session, collection_version_query(Venue, Show, ShowCount)))
+
+    async def render():
+        return venues_page(await fetch_all(session, Venue.area_listing_query(versioned=True)))
+    return await conditional(version, render)
+
+
+async def artists(session):
+    version = version_of(await fetch_first(session, collection_version_query(Artist)))
+
+    async def render():
+        return artists_page(await fetch_all(session, artist_listing_query()))
+    return await conditional(version, render)
+
+
+async def shows(session):
+    window, after = shows_arguments()
+    version = shows_version(version_of(await fetch_first(session, collection_version_query(Show, Venue, Artist))),
+                            window)
+
+    async def render():
+        return shows_page(await fetch_all(session, shows_query(window, after)), window)
+    return await conditional(version, render)
+
+
+async def show_venue(session, venue_id):
+    row = await fetch_first(session, Venue.page_version_query(venue_id))
+    if row is None:
+        return venue_page(None)
+    version = version_of(row)
+
+    async def detail():
+        venue = await fetch_entities(session, Venue.query.filter(Venue.id == venue_id))
+        if not venue:
+            return None
+        rows = await fetch_all(session, Venue.show_schedule_query(venue_id))
+        # genre names may need a lookup
+        return await run_sync(venue_detail_data, venue[0], *split_shows(rows, datetime.now()))
+
+    async def render():
+        return venue_page(await view_cache.get_or_set_async(venue_key(venue_id), detail, version))
+    return await conditional(version, render)
+
+
+async def show_artist(session, artist_id):
+    row = await fetch_first(session, Artist.page_version_query(artist_id))
+    if row is None:
+        return artist_page(None)
+    version = version_of(row)
+
+    async def detail():
+        artist = await fetch_entities(session, Artist.query.filter(Artist.id == artist_id))
+        if not artist:
+            return None
+        rows = await fetch_all(session, Artist.show_schedule_query(artist_id))
+        return await run_sync(artist_detail_data, artist[0], *split_shows(rows, datetime.now()))
+
+    async def render():
+        return artist_page(await view_cache.get_or_set_async(artist_key(artist_id), detail, version))
+    return await conditional(version, render)
+
+
+async def search(session, model, template):
+    search_term = request.form.get("search_term", "")
+    backend = name_search.backend
+    if isinstance(backend, TrigramSearch):
+        matches, count = backend.matches(await fetch_all(session, backend.query(model, search_term)))
+    else:
+        # the n-gram index lives in memory, but is built on first use
+        matches, count = await run_sync(backend.search, model, search_term)
+    return search_page(template, name_search.response(matches, count), search_term)
+
+
+async def search_by_city(session, model):
+    form = SearchByCityForm(request.form)
+    rows = await fetch_all(session, city_search_query(model, form.city.data, form.state.data))
+    return search_page("pages/search_venues.html", city_search_response(rows), f"{form.city.data}, {form.state.data}")
+
+
+ASYNC_VIEWS = {
+    "index": index,
+    "venues": venues,
+    "artists": artists,
+    "shows": shows,
+    "show_venue": show_venue,
+    "show_artist": show_artist,
+    "search_venues": lambda session: search(session, Venue, "pages/search_venues.html"),
+    "search_artists": lambda session: search(session, Artist, "pages/search_artists.html"),
+    "search_venue_by_city": lambda session: search_by_city(session, Venue),
+    "search_artist_by_city": lambda session: search_by_city(session, Artist),
+}
+
+
+#  Protocol
+#  ----------------------------------------------------------------
+
+
+def wsgi_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", ()):
+        name, value = name.decode("latin-1"), value.decode("latin-1")
+        if name == "content-type":
+            environ["CONTENT_TYPE"] = value
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    # the body is already read in full, which also covers chunked uploads
+    environ["CONTENT_LENGTH"] = str(len(body))
+    return environ
+
+
+def run_wsgi(environ, loop, queue, cancelled):
+    # runs the Flask app and iterates its body on one worker thread, which a
+    # streamed body's connection needs; puts (status, headers), then each
+    # chunk, then _DONE on the queue, waiting whenever the client lags
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def start_response(status, headers, exc_info=None):
+        put((int(status.split(" ", 1)[0]), headers))
+
+    try:
+        chunks = app(environ, start_response)
+        try:
+            for chunk in chunks:
+                if cancelled.is_set():
+                    break
+                if chunk:
+                    put(chunk)
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+    finally:
+        put(_DONE)
+
+
+async def send_wsgi(environ, send):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(STREAM_QUEUE_SIZE)
+    cancelled = threading.Event()
+    worker = loop.run_in_executor(None, run_wsgi, environ, loop, queue, cancelled)
+    item = None
+    try:
+        item = await queue.get()
+        if item is not _DONE:
+            await send_start(send, *item)
+            item = await queue.get()
+            while item is not _DONE:
+                await send({"type": "http.response.body", "body": item, "more_body": True})
+                item = await queue.get()
+            await send({"type": "http.response.body", "body": b""})
+    finally:
+        # a client gone mid-stream stops the iteration; drain so it can finish
+        cancelled.set()
+        while item is not _DONE:
+            item = await queue.get()
+    # raises what the app raised
+    await worker
+
+
+async def send_start(send, status, headers):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+    })
+
+
+async def call_async_view(environ, view):
+    with app.request_context(environ):
+        try:
+            # hooks such as the index warm-ups block, so they get a thread
+            if not app.got_first_request:
+                await run_sync(app.try_trigger_before_first_request_functions)
+            response = app.preprocess_request()
+            if response is None:
+                async with database.session() as session:
+                    response = await view(session, **request.view_args)
+            response = app.make_response(response)
+        except HTTPException as error:
+            response = app.make_response(app.handle_http_exception(error))
+        except Exception as error:
+            response = app.make_response(app.handle_exception(error))
+        response = app.process_response(response)
+        return response.status_code, list(response.headers.items()), response.get_data()
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await database.dispose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        raise RuntimeError(f"unsupported ASGI scope {scope['type']}")
+
+    environ = wsgi_environ(scope, await read_body(receive))
+    adapter = app.url_map.bind_to_environ(environ)
+    try:
+        endpoint, _ = adapter.match()
+    except HTTPException:
+        endpoint = None
+    view = ASYNC_VIEWS.get(endpoint)
+    if view is None:
+        return await send_wsgi(environ, send)
+    status, headers, body = await call_async_view(environ, view)
+    await send_start(send, status, headers)
+    await send({"type": "http.response.body", "body": body})
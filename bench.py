@@ -0,0 +1,453 @@
+"""Route benchmarks over synthetic datasets.
+
+    python bench.py --sizes 100,1000,10000 --requests 50
+
+For each size a scratch database (SQLite by default, see ``--database``) is
+filled by ``generate()`` with a deterministic catalogue scaled from the venue
+count, then every route in app.py is driven through the Flask test client.
+Per route it reports latency percentiles, SQL statements per request and the
+peak Python memory of one request, so routes that scale with the catalogue
+stand out. The database given with ``--database`` is dropped and recreated.
+
+``--datetime-rows 10000`` also times the ``datetime`` template filter on a
+page of that many shows, against the previous implementation that formatted
+every start time to a string and parsed it back.
+
+``--throughput-workers 4`` then compares requests per second over the read
+routes with that many worker processes serving them through the WSGI app,
+one request at a time each, and through ``asgi.application``, each worker
+keeping ``--concurrency`` requests in flight on its event loop.
+"""
+import asyncio
+import json
+import multiprocessing
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timedelta, time as time_of_day
+
+import click
+from sqlalchemy import event
+
+CITIES = [
+    ("New York", "NY"), ("San Francisco", "CA"), ("Los Angeles", "CA"), ("Austin", "TX"), ("Chicago", "IL"),
+    ("Seattle", "WA"), ("Nashville", "TN"), ("New Orleans", "LA"), ("Denver", "CO"), ("Boston", "MA"),
+]
+GENRES = [
+    "Alternative", "Blues", "Classical", "Country", "Electronic", "Folk", "Funk", "Hip-Hop", "Heavy Metal",
+    "Instrumental", "Jazz", "Musical Theatre", "Pop", "Punk", "R&B", "Reggae", "Rock n Roll", "Soul", "Other",
+]
+
+
+def generate(venues, artists, genres, shows, past_fraction=0.5, seed=0, now=None):
+    """Fill an empty schema with a deterministic catalogue.
+
+    Shows start within a year of `now`, `past_fraction` of them before it,
+    always inside the artist's availability window and never overlapping
+    another show of the same artist or venue.
+    """
+    from booking import IntervalIndex, VENUE, ARTIST
+    from models import db, Venue, Artist, Show, Genre, RollupState, venue_genre, artist_genre, DEFAULT_SHOW_MINUTES
+    from rollups import check
+
+    rng = random.Random(seed)
+    now = now or datetime.now()
+    names = (GENRES + [f"Genre {i}" for i in range(len(GENRES), genres)])[:genres]
+    db.session.execute(Genre.__table__.insert(), [{"id": i + 1, "name": name} for i, name in enumerate(names)])
+
+    venue_rows, venue_links = [], []
+    for venue_id in range(1, venues + 1):
+        city, state = rng.choice(CITIES)
+        seeking = rng.random() < 0.5
+        genre_ids = sorted(rng.sample(range(1, genres + 1), min(genres, 3)))
+        venue_rows.append({
+            "id": venue_id, "name": f"Venue {venue_id}", "city": city, "state": state,
+            "address": f"{venue_id} Main St", "phone": "555-0100", "image_link": f"https://img.example/v/{venue_id}",
+            "seeking_talent": seeking, "seeking_description": "Looking for local acts",
+            "genre_ids": genre_ids, "updated_at": now,
+        })
+        venue_links.extend({"venue_id": venue_id, "genre_id": genre_id} for genre_id in genre_ids)
+    db.session.execute(Venue.__table__.insert(), venue_rows)
+    db.session.execute(venue_genre.insert(), venue_links)
+
+    artist_rows, artist_links, windows = [], [], {}
+    for artist_id in range(1, artists + 1):
+        city, state = rng.choice(CITIES)
+        opens = rng.randint(8, 16)
+        windows[artist_id] = (opens, rng.randint(opens + 2, 23))
+        seeking = rng.random() < 0.5
+        genre_ids = sorted(rng.sample(range(1, genres + 1), min(genres, 2)))
+        artist_rows.append({
+            "id": artist_id, "name": f"Artist {artist_id}", "city": city, "state": state, "phone": "555-0199",
+            "image_link": f"https://img.example/a/{artist_id}", "seeking_venue": seeking,
+            "time_available_from": time_of_day(windows[artist_id][0]),
+            "time_available_to": time_of_day(windows[artist_id][1]), "genre_ids": genre_ids, "updated_at": now,
+        })
+        artist_links.extend({"artist_id": artist_id, "genre_id": genre_id} for genre_id in genre_ids)
+    db.session.execute(Artist.__table__.insert(), artist_rows)
+    db.session.execute(artist_genre.insert(), artist_links)
+
+    show_rows = []
+    bookings = {}
+    duration = timedelta(minutes=DEFAULT_SHOW_MINUTES)
+    while len(show_rows) < shows:
+        artist_id, venue_id = rng.randint(1, artists), rng.randint(1, venues)
+        opens, closes = windows[artist_id]
+        days = rng.randint(1, 365) * (-1 if rng.random() < past_fraction else 1)
+        day = (now + timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+        start_time = day + timedelta(hours=rng.randint(opens, closes - 1))
+        indexes = [bookings.setdefault(key, IntervalIndex()) for key in ((ARTIST, artist_id), (VENUE, venue_id))]
+        if any(index.conflict(start_time, start_time + duration) is not None for index in indexes):
+            continue
+        show_id = len(show_rows) + 1
+        for index in indexes:
+            index.add(start_time, start_time + duration, show_id)
+        show_rows.append({
+            "id": show_id, "artist_id": artist_id, "venue_id": venue_id, "start_time": start_time,
+            "end_time": start_time + duration, "updated_at": now,
+        })
+    db.session.execute(Show.__table__.insert(), show_rows)
+
+    db.session.merge(RollupState(id=1, rolled_to=now))
+    if db.engine.dialect.name == "postgresql":
+        # explicit ids leave the serial sequences behind
+        for table in ("genres", "venues", "artists", "shows"):
+            db.session.execute(db.text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                                       f"(SELECT max(id) FROM {table}))"))
+    db.session.commit()
+    check(repair=True)
+
+
+def check_facets():
+    # every facet of the browse endpoints counts at least one real value
+    from facets import FACETED, FACETS
+
+    for model, faceted in FACETED.items():
+        counted = {facet for facet, value, count in faceted.counts({}) if value is not None}
+        missing = sorted(set(FACETS) - counted)
+        if missing:
+            raise click.ClickException(f"{model.__tablename__} browse counts no values for {', '.join(missing)}")
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def routes(venues, artists):
+    # (label, method, path, form data factory) for every route in app.py;
+    # data factories take the iteration number so writes don't collide
+    future = (datetime.now() + timedelta(days=30)).replace(hour=20, minute=0, second=0, microsecond=0)
+    return [
+        ("index", "GET", "/", None),
+        ("venues", "GET", "/venues", None),
+        ("artists", "GET", "/artists", None),
+        ("shows", "GET", "/shows", None),
+        ("shows month", "GET", "/shows?window=month", None),
+        ("shows past", "GET", "/shows?window=past", None),
+        ("show_venue", "GET", "/venues/1", None),
+        ("show_artist", "GET", "/artists/1", None),
+        ("search_venues", "POST", "/venues/search", lambda i: {"search_term": "nue 1"}),
+        ("search_artists", "POST", "/artists/search", lambda i: {"search_term": "ist 1"}),
+        ("search_venue_by_city", "POST", "/venues/search_by_city", lambda i: {"city": "Austin", "state": "TX"}),
+        ("search_artist_by_city", "POST", "/artists/search_by_city", lambda i: {"city": "Austin", "state": "TX"}),
+        ("create_venue_form", "GET", "/venues/create", None),
+        ("create_artist_form", "GET", "/artists/create", None),
+        ("create_shows", "GET", "/shows/create", None),
+        ("create_show_batch", "GET", "/shows/batch", None),
+        ("edit_venue", "GET", "/venues/1/edit", None),
+        ("edit_artist", "GET", "/artists/1/edit", None),
+        ("cache_stats", "GET", "/cache/stats", None),
+        ("autocomplete", "GET", "/autocomplete?q=ven", None),
+        ("browse_venues", "GET", "/api/v1/venues/browse", None),
+        ("browse_artists", "GET", "/api/v1/artists/browse?state=TX&seeking=true", None),
+        ("create_venue_submission", "POST", "/venues/create", lambda i: {
+            "name": f"Bench Venue {i}", "city": "Austin", "state": "TX", "address": "1 Bench St", "phone": "1",
+            "genres": ["Jazz", "Blues"]}),
+        ("create_artist_submission", "POST", "/artists/create", lambda i: {
+            "name": f"Bench Artist {i}", "city": "Austin", "state": "TX", "phone": "1", "genres": ["Jazz"],
+            "time_available_from": "00:00", "time_available_to": "23:59"}),
+        ("create_show_submission", "POST", "/shows/create", lambda i: {
+            "artist_id": str(artists + 1), "venue_id": "1", "duration": "60",
+            "start_time": (future + timedelta(days=400 + i)).strftime("%Y-%m-%d %H:%M:%S")}),
+        ("show_batch_submission", "POST", "/shows/batch", lambda i: {"shows": "\n".join(
+            f"{artists + 1},{venue_id},{(future + timedelta(days=800 + i)).strftime('%Y-%m-%d')} {hour}:00,60"
+            for venue_id in range(1, 6) for hour in range(12, 22, 2))}),
+        ("edit_venue_submission", "POST", "/venues/1/edit", lambda i: {
+            "name": "Venue 1", "city": "Austin", "state": "TX", "address": "1 Main St", "phone": "1",
+            "genres": ["Jazz"]}),
+        ("edit_artist_submission", "POST", "/artists/1/edit", lambda i: {
+            "name": "Artist 1", "city": "Austin", "state": "TX", "phone": "1", "genres": ["Jazz"],
+            "time_available_from": "00:00", "time_available_to": "23:59"}),
+        ("delete_venue", "DELETE", lambda i: f"/venues/{venues - i}", None),
+    ]
+
+
+def measure(app, client, method, path, data, requests):
+    from models import db
+
+    view_cache = app.extensions["view_cache"]
+    statements = []
+    latencies = []
+
+    def count(*args):
+        statements[-1] += 1
+
+    event.listen(db.engine, "before_cursor_execute", count)
+    try:
+        for i in range(requests):
+            # cold view cache: measure the work a request does, not the cache
+            view_cache.clear()
+            url = path(i) if callable(path) else path
+            form = data(i) if data else None
+            statements.append(0)
+            started = time.perf_counter()
+            response = client.open(url, method=method, data=form)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 500:
+                raise click.ClickException(f"{method} {url} answered {response.status_code}")
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count)
+
+    view_cache.clear()
+    url = path(requests) if callable(path) else path
+    tracemalloc.start()
+    try:
+        client.open(url, method=method, data=data(requests) if data else None)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "p50_ms": percentile(latencies, 0.50), "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99), "mean_ms": statistics.mean(latencies),
+        "queries": max(statements), "peak_kib": peak / 1024,
+    }
+
+
+def reset_app_state(app):
+    # process-local caches would otherwise carry over between datasets
+    from booking import booking_index
+    from models import genre_resolver
+
+    app.extensions["view_cache"].clear()
+    app.jinja_env.fragment_cache.clear()
+    app.extensions["name_search"]._backends.clear()
+    app.extensions["name_search"]._prefixes.clear()
+    app.extensions["recent_listings"]._buffers.clear()
+    genre_resolver.clear()
+    booking_index.clear()
+
+
+def run(app, sizes, requests):
+    from models import db
+
+    results = {}
+    for size in sizes:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            generate(venues=size, artists=size, genres=min(max(size // 10, 5), 100), shows=size * 10)
+            reset_app_state(app)
+            check_facets()
+            client = app.test_client()
+            # one artist available all day so create_show_submission passes
+            client.post("/artists/create", data={
+                "name": "Bench Headliner", "city": "Austin", "state": "TX", "phone": "1", "genres": ["Jazz"],
+                "time_available_from": "00:00", "time_available_to": "23:59"})
+            results[size] = {
+                label: measure(app, client, method, path, data, requests)
+                for label, method, path, data in routes(size, size)
+            }
+    return results
+
+
+def legacy_format_datetime(value, format="medium"):
+    # the filter as it was before views passed datetime objects
+    import babel.dates
+    import dateutil.parser
+
+    date = dateutil.parser.parse(value)
+    if format == "full":
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == "medium":
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale="en")
+
+
+def time_datetime_filter(rows, repeat=3):
+    # best of `repeat` runs, in microseconds per row, of formatting `rows`
+    # show start times the old way (strftime in the view, then parse and
+    # format in the filter) and the current way
+    from app import format_datetime
+
+    rng = random.Random(0)
+    now = datetime.now().replace(microsecond=0)
+    starts = [now + timedelta(minutes=rng.randint(-500000, 500000)) for _ in range(rows)]
+
+    def legacy():
+        for start in starts:
+            legacy_format_datetime(start.strftime("%Y-%m-%dT%H:%M:%S.000Z"), "full")
+
+    def current():
+        for start in starts:
+            format_datetime(start, "full")
+
+    timings = {}
+    for label, render in (("before", legacy), ("after", current)):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            render()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        timings[label] = best / rows * 1e6
+    return timings
+
+
+def read_routes(venues, artists):
+    # the routes asgi.py serves from the asyncio engine
+    served = {"index", "venues", "artists", "shows", "shows month", "shows past", "show_venue", "show_artist",
+              "search_venues", "search_artists", "search_venue_by_city", "search_artist_by_city"}
+    return [(method, path, data) for label, method, path, data in routes(venues, artists) if label in served]
+
+
+def clear_view_cache(app):
+    # the cache backend is looked up through current_app; the context is
+    # only held for the clear, so concurrent ASGI requests keep their own
+    with app.app_context():
+        app.extensions["view_cache"].clear()
+
+
+def wsgi_worker(database, size, seconds, concurrency):
+    # requests served one at a time through the Flask test client
+    from app import app
+
+    app.config["SQLALCHEMY_DATABASE_URI"] = database
+    app.config["WTF_CSRF_ENABLED"] = False
+    client = app.test_client()
+    targets = read_routes(size, size)
+    served = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        method, path, data = targets[served % len(targets)]
+        clear_view_cache(app)
+        response = client.open(path, method=method, data=data(served) if data else None)
+        if response.status_code >= 500:
+            raise RuntimeError(f"{method} {path} answered {response.status_code}")
+        served += 1
+    return served
+
+
+def asgi_worker(database, size, seconds, concurrency):
+    # `concurrency` clients sharing one event loop, calling the ASGI app
+    from urllib.parse import urlencode
+
+    from app import app
+
+    app.config["SQLALCHEMY_DATABASE_URI"] = database
+    app.config["WTF_CSRF_ENABLED"] = False
+    from asgi import application, database as async_database
+
+    targets = read_routes(size, size)
+    served = 0
+
+    async def call(method, path, data):
+        body = urlencode(data, doseq=True).encode() if data else b""
+        headers = [(b"content-type", b"application/x-www-form-urlencoded")] if data else []
+        scope = {"type": "http", "method": method, "path": path.split("?")[0], "headers": headers,
+                 "query_string": path.partition("?")[2].encode(), "http_version": "1.1"}
+        messages = [{"type": "http.request", "body": body}]
+        status = {}
+
+        async def receive():
+            return messages.pop()
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+
+        await application(scope, receive, send)
+        return status["code"]
+
+    async def client(deadline):
+        nonlocal served
+        while time.perf_counter() < deadline:
+            method, path, data = targets[served % len(targets)]
+            clear_view_cache(app)
+            code = await call(method, path, data(served) if data else None)
+            if code >= 500:
+                raise RuntimeError(f"{method} {path} answered {code}")
+            served += 1
+
+    async def serve():
+        deadline = time.perf_counter() + seconds
+        try:
+            await asyncio.gather(*(client(deadline) for _ in range(concurrency)))
+        finally:
+            await async_database.dispose()
+
+    asyncio.run(serve())
+    return served
+
+
+def throughput(database, size, workers, seconds, concurrency):
+    # requests per second for each serving mode with `workers` processes;
+    # spawned so no worker inherits the parent's connections
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    with context.Pool(workers) as pool:
+        for mode, worker in (("wsgi", wsgi_worker), ("asgi", asgi_worker)):
+            served = pool.starmap(worker, [(database, size, seconds, concurrency)] * workers)
+            results[mode] = sum(served) / seconds
+    return results
+
+
+def report(results):
+    for size, rows in results.items():
+        click.echo(f"\n{size} venues / {size} artists / {size * 10} shows")
+        click.echo(f"{'route':<26}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'peak KiB':>10}")
+        for label, row in rows.items():
+            click.echo(f"{label:<26}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}"
+                       f"{row['queries']:>9}{row['peak_kib']:>10.0f}")
+
+
+@click.command()
+@click.option("--sizes", default="100,1000", show_default=True, help="Comma separated venue counts.")
+@click.option("--requests", default=20, show_default=True, help="Requests per route and size.")
+@click.option("--database", default="sqlite:///bench.db", show_default=True,
+              help="Scratch database URI. It is dropped and recreated.")
+@click.option("--datetime-rows", default=0, show_default=True,
+              help="Also time the datetime filter on a page of this many shows.")
+@click.option("--throughput-workers", default=0, show_default=True,
+              help="Also compare WSGI and ASGI read throughput with this many worker processes.")
+@click.option("--concurrency", default=10, show_default=True, help="Requests in flight per ASGI worker.")
+@click.option("--seconds", default=10, show_default=True, help="Duration of each throughput run.")
+@click.option("--json", "json_path", type=click.Path(dir_okay=False), help="Also write the results as JSON.")
+def main(sizes, requests, database, datetime_rows, throughput_workers, concurrency, seconds, json_path):
+    """Benchmark every route at several dataset sizes."""
+    from app import app
+
+    app.config["SQLALCHEMY_DATABASE_URI"] = database
+    app.config["WTF_CSRF_ENABLED"] = False
+    sizes = [int(size) for size in sizes.split(",")]
+    results = run(app, sizes, requests)
+    report(results)
+    if throughput_workers:
+        # served against the dataset the last size left behind
+        rates = throughput(database, sizes[-1], throughput_workers, seconds, concurrency)
+        results["throughput"] = dict(rates, workers=throughput_workers, concurrency=concurrency)
+        click.echo(f"\nread throughput with {throughput_workers} workers: {rates['wsgi']:.0f} req/s WSGI, "
+                   f"{rates['asgi']:.0f} req/s ASGI ({concurrency} in flight per worker)")
+    if datetime_rows:
+        timings = time_datetime_filter(datetime_rows)
+        results["datetime_filter"] = dict(timings, rows=datetime_rows)
+        click.echo(f"\ndatetime filter over {datetime_rows} shows: {timings['before']:.1f} us/row before, "
+                   f"{timings['after']:.1f} us/row after")
+    if json_path:
+        with open(json_path, "w") as stream:
+            json.dump(results, stream, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Double-booking checks for artists and venues.
+
+Shows occupy ``[start_time, end_time)``. On Postgres the exclusion
+constraints of each ``shows`` partition reject overlapping bookings of one
+artist or one venue within the month; every database also gets
+``BookingIndex``, an in-process index that answers "does this slot
+collide?" with a binary search so the booking form can explain the conflict
+before anything is written.
+
+An entity's bookings never overlap, so sorted by start they are also sorted
+by end and only the neighbours of the insertion point need checking. Indexes
+are loaded per entity on first use and dropped after ``BOOKING_INDEX_TTL``
+seconds so bookings made by other workers are picked up. Bulk writers
+(``flask import``) call ``BookingIndex.touch`` to drop them in every worker
+at once, through a generation token in the view cache backend (Redis, for
+more than one process).
+
+``check_batch`` validates many prospective bookings at once: the artists,
+venues and existing shows they touch are read in one query each, and every
+row is checked against interval indexes holding those shows plus the rows
+accepted before it.
+"""
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import defaultdict
+
+from flask import current_app
+
+from cache import _MISSING
+from models import db, Venue, Artist, all_shows, is_available
+
+VENUE = "venue"
+ARTIST = "artist"
+GENERATION_KEY = "booking:generation"
+
+
+class IntervalIndex:
+    """Disjoint [start, end) intervals of one entity, sorted by start."""
+
+    def __init__(self, intervals=()):
+        intervals = sorted(intervals)
+        self.starts = [start for start, _, _ in intervals]
+        self.ends = [end for _, end, _ in intervals]
+        self.show_ids = [show_id for _, _, show_id in intervals]
+
+    def conflict(self, start, end):
+        # (start, end, show id) of a booking overlapping [start, end), or None
+        position = bisect_left(self.starts, end) - 1
+        if position >= 0 and self.ends[position] > start:
+            return self.starts[position], self.ends[position], self.show_ids[position]
+        return None
+
+    def add(self, start, end, show_id):
+        position = bisect_left(self.starts, start)
+        self.starts.insert(position, start)
+        self.ends.insert(position, end)
+        self.show_ids.insert(position, show_id)
+
+    def discard(self, start):
+        position = bisect_left(self.starts, start)
+        if position < len(self.starts) and self.starts[position] == start:
+            del self.starts[position], self.ends[position], self.show_ids[position]
+
+    def __len__(self):
+        return len(self.starts)
+
+
+class BookingIndex:
+    def __init__(self):
+        self.indexes = {}
+        self.generation = _MISSING
+        self.lock = threading.Lock()
+
+    def _refresh(self):
+        # drops every index when a bulk writer touched the bookings since
+        generation = current_app.extensions["view_cache"].backend.get(GENERATION_KEY)
+        with self.lock:
+            if generation != self.generation:
+                self.indexes.clear()
+                self.generation = generation
+
+    def touch(self):
+        # for writes that bypass the handlers, e.g. bulk imports
+        current_app.extensions["view_cache"].backend.set(GENERATION_KEY, uuid.uuid4().hex, expire=False)
+
+    def _index(self, entity_type, entity_id):
+        key = (entity_type, entity_id)
+        ttl = current_app.config.get("BOOKING_INDEX_TTL", 60)
+        with self.lock:
+            entry = self.indexes.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+        # archived shows are past, but a backdated booking can still hit them
+        shows = all_shows("id", "start_time", "end_time", "venue_id", "artist_id")
+        column = shows.c.venue_id if entity_type == VENUE else shows.c.artist_id
+        rows = db.session.query(shows.c.start_time, shows.c.end_time, shows.c.id).filter(column == entity_id)
+        index = IntervalIndex(tuple(row) for row in rows)
+        with self.lock:
+            self.indexes[key] = (time.monotonic() + ttl, index)
+        return index
+
+    def conflicts(self, venue_id, artist_id, start, end):
+        # [(entity type, conflicting show id)] for a prospective booking
+        self._refresh()
+        found = []
+        for entity_type, entity_id in ((ARTIST, artist_id), (VENUE, venue_id)):
+            index = self._index(entity_type, entity_id)
+            with self.lock:
+                booking = index.conflict(start, end)
+            if booking is not None:
+                found.append((entity_type, booking[2]))
+        return found
+
+    def add(self, venue_id, artist_id, start, end, show_id=None):
+        with self.lock:
+            for key in ((ARTIST, artist_id), (VENUE, venue_id)):
+                entry = self.indexes.get(key)
+                if entry is not None:
+                    entry[1].add(start, end, show_id)
+
+    def forget_venue(self, venue_id):
+        # the venue's shows went with it; artist indexes reload lazily
+        with self.lock:
+            for key in [key for key in self.indexes if key[0] == ARTIST or key == (VENUE, venue_id)]:
+                del self.indexes[key]
+
+    def clear(self):
+        with self.lock:
+            self.indexes.clear()
+            self.generation = _MISSING
+
+
+booking_index = BookingIndex()
+
+
+def check_batch(bookings):
+    """Validate prospective bookings as a whole.
+
+    `bookings` is a sequence of (artist_id, venue_id, start, end). Returns
+    one error message per booking, None when it can be booked. Within the
+    batch the earlier of two overlapping bookings wins; rows are numbered
+    from 1 in the messages.
+    """
+    if not bookings:
+        return []
+    artist_ids = {artist_id for artist_id, _, _, _ in bookings}
+    venue_ids = {venue_id for _, venue_id, _, _ in bookings}
+    artists = {
+        artist_id: (available_from, available_to)
+        for artist_id, available_from, available_to in
+        db.session.query(Artist.id, Artist.time_available_from, Artist.time_available_to)
+        .filter(Artist.id.in_(artist_ids))
+    }
+    venues = {venue_id for venue_id, in db.session.query(Venue.id).filter(Venue.id.in_(venue_ids))}
+
+    # only shows overlapping the batch's overall time span can conflict
+    earliest = min(start for _, _, start, _ in bookings)
+    latest = max(end for _, _, _, end in bookings)
+    intervals = defaultdict(list)
+    shows = all_shows("artist_id", "venue_id", "start_time", "end_time", "id")
+    rows = db.session.query(*shows.c) \
+        .filter(db.or_(shows.c.artist_id.in_(artist_ids), shows.c.venue_id.in_(venue_ids)),
+                shows.c.start_time < latest, shows.c.end_time > earliest)
+    for artist_id, venue_id, start, end, show_id in rows:
+        if artist_id in artist_ids:
+            intervals[ARTIST, artist_id].append((start, end, f"show {show_id}"))
+        if venue_id in venue_ids:
+            intervals[VENUE, venue_id].append((start, end, f"show {show_id}"))
+    indexes = defaultdict(IntervalIndex, {key: IntervalIndex(found) for key, found in intervals.items()})
+
+    errors = []
+    for position, (artist_id, venue_id, start, end) in enumerate(bookings):
+        availability = artists.get(artist_id)
+        if availability is None:
+            errors.append(f"artist {artist_id} does not exist")
+        elif venue_id not in venues:
+            errors.append(f"venue {venue_id} does not exist")
+        elif end <= start:
+            errors.append("the show must end after it starts")
+        elif not is_available(*availability, start.time()):
+            errors.append(f"artist {artist_id} will not be available at {start.time()}")
+        else:
+            errors.append(None)
+            for entity_type, entity_id in ((ARTIST, artist_id), (VENUE, venue_id)):
+                booking = indexes[entity_type, entity_id].conflict(start, end)
+                if booking is not None:
+                    errors[-1] = f"{entity_type} {entity_id} is already booked for {booking[2]} at that time"
+                    break
+            if errors[-1] is None:
+                indexes[ARTIST, artist_id].add(start, end, f"row {position + 1}")
+                indexes[VENUE, venue_id].add(start, end, f"row {position + 1}")
+    return errors
@@ -0,0 +1,254 @@
+"""Read-through cache for the view models behind the detail pages.
+
+``CACHE_BACKEND`` selects where entries live:
+
+* ``"memory"`` (default) - a per-process LRU bounded by ``CACHE_MAX_ENTRIES``
+  whose entries expire after ``CACHE_TTL`` seconds.
+* ``"redis"`` - a Redis-compatible server at ``CACHE_REDIS_URL`` shared by
+  every worker. Needs the ``redis`` package.
+
+Other modules also keep generation tokens in the backend to tell workers
+about writes (feed.py, search.py, booking.py), and the CLI writers delete
+entries from it. Those only reach other processes through Redis.
+
+Write handlers call ``ViewCache.delete`` with the keys they made stale.
+Entries are stored with the version the page's conditional request was
+answered with (see ``app.conditional``), and an entry whose version differs
+is rebuilt, so a body never lags the ETag sent with it, e.g. when a show
+moves from upcoming to past. Entries may be built from a replica, so a
+client that wrote recently (see routing.py) bypasses the cache.
+
+Templates can also cache fragments of their own output in a per-process LRU
+bounded by ``FRAGMENT_CACHE_MAX_ENTRIES``::
+
+    {% cache ("venue", venue.id), venue.updated_at %} ... {% endcache %}
+
+The first expression keys the fragment, the second versions it, so a
+changed entity simply misses and its old fragment ages out of the LRU.
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_request_context
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+from routing import is_sticky
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - optional dependency
+    redis = None
+
+_MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return _MISSING
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expire=True):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl if expire else float("inf"), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def info(self):
+        return {"backend": "memory", "size": len(self.entries), "max_entries": self.max_entries,
+                "evictions": self.evictions}
+
+
+class RedisCache:
+    def __init__(self, url, ttl=60, prefix="fyyur:view:"):
+        if redis is None:
+            raise RuntimeError("CACHE_BACKEND = 'redis' needs the redis package installed")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return _MISSING
+        return pickle.loads(raw)
+
+    def set(self, key, value, expire=True):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=self.ttl if expire else None)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(key)
+
+    def info(self):
+        return {"backend": "redis"}
+
+
+class ViewCache:
+    """Flask extension wrapping the configured cache backend."""
+
+    def __init__(self, app=None):
+        self._backends = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("CACHE_BACKEND", "memory")
+        app.config.setdefault("CACHE_MAX_ENTRIES", 1024)
+        app.config.setdefault("CACHE_TTL", 60)
+        app.config.setdefault("CACHE_REDIS_URL", "redis://localhost:6379/0")
+        app.config.setdefault("FRAGMENT_CACHE_MAX_ENTRIES", 10000)
+        app.config.setdefault("FRAGMENT_CACHE_TTL", 3600)
+        app.extensions["view_cache"] = self
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.fragment_cache = LRUCache(app.config["FRAGMENT_CACHE_MAX_ENTRIES"],
+                                                ttl=app.config["FRAGMENT_CACHE_TTL"])
+
+    @property
+    def backend(self):
+        app = current_app._get_current_object()
+        backend = self._backends.get(app)
+        if backend is None:
+            if app.config["CACHE_BACKEND"] == "redis":
+                backend = RedisCache(app.config["CACHE_REDIS_URL"], ttl=app.config["CACHE_TTL"])
+            else:
+                backend = LRUCache(app.config["CACHE_MAX_ENTRIES"], ttl=app.config["CACHE_TTL"])
+            self._backends[app] = backend
+        return backend
+
+    def _lookup(self, key, version):
+        # the cached value when it was stored for `version`, else _MISSING
+        entry = self.backend.get(key)
+        hit = entry is not _MISSING and entry[0] == version
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entry[1] if hit else _MISSING
+
+    def _bypassed(self):
+        # a sticky client reads the primary, which may be ahead of the
+        # replica an entry was built from
+        return has_request_context() and is_sticky()
+
+    def get_or_set(self, key, builder, version=None):
+        # builder() results of None (missing entity) are not cached
+        if self._bypassed():
+            return builder()
+        value = self._lookup(key, version)
+        if value is not _MISSING:
+            return value
+        value = builder()
+        if value is not None:
+            self.backend.set(key, (version, value))
+        return value
+
+    async def get_or_set_async(self, key, builder, version=None):
+        # get_or_set for a coroutine function builder, used by asgi.py
+        if self._bypassed():
+            return await builder()
+        value = self._lookup(key, version)
+        if value is not _MISSING:
+            return value
+        value = await builder()
+        if value is not None:
+            self.backend.set(key, (version, value))
+        return value
+
+    def delete(self, *keys):
+        self.backend.delete(*keys)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        with self.lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        stats = {"hits": hits, "misses": misses, "hit_ratio": hits / lookups if lookups else 0.0}
+        stats.update(self.backend.info())
+        stats["fragments"] = current_app.jinja_env.fragment_cache.info()
+        return stats
+
+
+class FragmentCacheExtension(Extension):
+    """Jinja ``{% cache key, version %}`` tag backed by an LRUCache."""
+
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        # sized from the app config by ViewCache.init_app
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        # fragments are keyed per template, so two templates may reuse a key
+        args = [nodes.Const(parser.name), parser.parse_expression()]
+        if parser.stream.skip_if("comma"):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(self.call_method("_render", args), [], [], body).set_lineno(lineno)
+
+    def _render(self, template, key, version, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        cache_key = (template, key, version)
+        fragment = cache.get(cache_key)
+        if fragment is _MISSING:
+            # Markup when the template autoescapes, so it is not escaped again
+            fragment = caller()
+            cache.set(cache_key, fragment)
+        return fragment
+
+
+def shared_between_processes(app):
+    # whether deletes and generation tokens reach the other workers
+    return app.config["CACHE_BACKEND"] == "redis"
+
+
+def venue_key(venue_id):
+    return f"venue:{venue_id}"
+
+
+def artist_key(artist_id):
+    return f"artist:{artist_id}"
@@ -0,0 +1,118 @@
+"""Query plan regression check for the hot routes.
+
+    flask explain-check
+
+Drives every read route through the test client against the configured
+Postgres database, captures the SELECT statements each one issues and runs
+``EXPLAIN`` on them with ``enable_seqscan`` turned off. With sequential scans
+disabled the planner still falls back to one when no index can serve the
+query, so a ``Seq Scan`` node points at a missing or unusable index no matter
+how small the seeded tables are. The command exits non-zero when a route
+scans a table it is not expected to read in full.
+"""
+import json
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event
+
+from models import db, Venue, Artist
+
+# (method, path, form data, tables the route legitimately reads in full)
+HOT_PATHS = [
+    ("GET", "/", None, ()),
+    ("GET", "/venues", None, ("venues",)),
+    ("GET", "/artists", None, ("artists",)),
+    ("GET", "/shows", None, ()),
+    ("GET", "/shows?window=month", None, ()),
+    ("GET", "/shows?window=past", None, ()),
+    ("GET", "/venues/{venue_id}", None, ()),
+    ("GET", "/artists/{artist_id}", None, ()),
+    ("POST", "/venues/search", {"search_term": "{venue_term}"}, ()),
+    ("POST", "/artists/search", {"search_term": "{artist_term}"}, ()),
+    ("POST", "/venues/search_by_city", {"city": "{venue_city}", "state": "{venue_state}"}, ()),
+    ("POST", "/artists/search_by_city", {"city": "{artist_city}", "state": "{artist_state}"}, ()),
+]
+
+
+def sample_values():
+    # real ids and terms so every route takes its data path, not a 404
+    venue = Venue.query.order_by(Venue.id).first()
+    artist = Artist.query.order_by(Artist.id).first()
+    if venue is None or artist is None:
+        raise click.ClickException("seed the database with at least one venue and artist first")
+    return {
+        "venue_id": venue.id, "venue_term": venue.name[:4], "venue_city": venue.city, "venue_state": venue.state,
+        "artist_id": artist.id, "artist_term": artist.name[:4], "artist_city": artist.city or "",
+        "artist_state": artist.state or "",
+    }
+
+
+def seq_scans(plan):
+    # relation names of every Seq Scan node in an EXPLAIN (FORMAT JSON) plan
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", ()):
+        found.extend(seq_scans(child))
+    return found
+
+
+def capture(client, method, path, data):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        response = client.open(path, method=method, data=data)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+    if response.status_code >= 400:
+        raise click.ClickException(f"{method} {path} answered {response.status_code}")
+    return statements
+
+
+def explain(statement, parameters):
+    with db.engine.connect() as connection:
+        with connection.begin():
+            connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+            plan = connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def check_plans():
+    # returns [(route, statement, unexpected seq-scanned tables)]
+    values = sample_values()
+    client = current_app.test_client()
+    view_cache = current_app.extensions.get("view_cache")
+    failures = []
+    for method, path, form, allowed in HOT_PATHS:
+        path = path.format(**values)
+        data = {key: value.format(**values) for key, value in form.items()} if form else None
+        if view_cache is not None:
+            view_cache.clear()
+        for statement, parameters in capture(client, method, path, data):
+            scanned = [table for table in seq_scans(explain(statement, parameters)) if table not in allowed]
+            if scanned:
+                failures.append((f"{method} {path}", statement, scanned))
+    return failures
+
+
+@click.command("explain-check")
+@with_appcontext
+def explain_check_command():
+    """Fail if a hot route's queries fall back to sequential scans."""
+    if db.engine.dialect.name != "postgresql":
+        raise click.ClickException("explain-check needs a Postgres database")
+    failures = check_plans()
+    for route, statement, tables in failures:
+        click.echo(f"{route}: Seq Scan on {', '.join(tables)}\n    {' '.join(statement.split())}", err=True)
+    if failures:
+        raise click.ClickException(f"{len(failures)} queries regressed to sequential scans")
+    click.echo(f"All {len(HOT_PATHS)} hot routes use indexes.")
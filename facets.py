@@ -0,0 +1,173 @@
+"""Faceted browsing of venues and artists.
+
+``/api/v1/venues/browse`` and ``/api/v1/artists/browse`` filter on any of
+
+* ``genre`` - repeatable, matches entities with any of the given genres,
+* ``state`` and ``city``,
+* ``seeking`` - ``seeking_talent`` for venues, ``seeking_venue`` for artists,
+* ``upcoming`` - whether the entity has upcoming shows (from show_counts),
+
+and answer with one keyset page of the matches plus the number of entities
+for every value of every facet. A facet's counts apply all the other
+filters but not its own, so the values next to a selected one stay usable.
+
+All counts come from one aggregate statement over entities joined to their
+genres: a GROUPING SETS query on Postgres, a UNION ALL of per-facet GROUP BYs
+elsewhere. Each count is a ``count(DISTINCT id)`` restricted by a CASE to the
+rows matching the other filters, so no facet needs its own COUNT.
+"""
+from models import db, Venue, Artist, Genre, ShowCount, venue_genre, artist_genre
+
+FACETS = ("genre", "state", "city", "seeking", "upcoming")
+BROWSE_PAGE_SIZE = 30
+TRUE_VALUES = {"1", "true", "yes"}
+FALSE_VALUES = {"0", "false", "no"}
+
+
+class Faceted:
+    """The columns one model is browsed by."""
+
+    def __init__(self, model, links, link_column, seeking, entity_type):
+        self.model = model
+        self.links = links
+        self.link_column = link_column
+        self.seeking = seeking
+        self.entity_type = entity_type
+
+    def upcoming(self):
+        # literal zeros, so Postgres sees the same expression in SELECT and
+        # GROUP BY rather than two differently bound parameters
+        return db.func.coalesce(ShowCount.upcoming, db.literal_column("0"))
+
+    def has_upcoming(self):
+        return self.upcoming() > db.literal_column("0")
+
+    def with_counts(self, query):
+        return query.outerjoin(ShowCount, db.and_(ShowCount.entity_type == self.entity_type,
+                                                  ShowCount.entity_id == self.model.id))
+
+    def predicates(self, filters):
+        # {facet: condition} for the filters given
+        model = self.model
+        predicates = {}
+        if filters.get("genre"):
+            if db.engine.dialect.name == "postgresql":
+                # genre_ids && ARRAY[...] is answered by the GIN index
+                genre_ids = db.select(db.func.array_agg(Genre.id)).where(Genre.name.in_(filters["genre"]))
+                predicates["genre"] = model.genre_ids.overlap(genre_ids.scalar_subquery())
+            else:
+                genre_ids = db.select(Genre.id).where(Genre.name.in_(filters["genre"]))
+                predicates["genre"] = model.id.in_(
+                    db.select(self.link_column).where(self.links.c.genre_id.in_(genre_ids)))
+        if filters.get("state"):
+            predicates["state"] = model.state == filters["state"]
+        if filters.get("city"):
+            predicates["city"] = model.city == filters["city"]
+        if filters.get("seeking") is not None:
+            predicates["seeking"] = self.seeking.is_(True) if filters["seeking"] else \
+                db.or_(self.seeking.is_(False), self.seeking.is_(None))
+        if filters.get("upcoming") is not None:
+            predicates["upcoming"] = self.has_upcoming() if filters["upcoming"] else db.not_(self.has_upcoming())
+        return predicates
+
+    def page(self, predicates, after=None, limit=BROWSE_PAGE_SIZE):
+        model = self.model
+        query = self.with_counts(db.session.query(model.id, model.name, model.city, model.state,
+                                                  model.genre_ids, self.seeking.label("seeking"),
+                                                  self.upcoming().label("num_upcoming_shows")))
+        query = query.filter(*predicates.values())
+        if after is not None:
+            query = query.filter(model.id > after)
+        return query.order_by(model.id.asc()).limit(limit).all()
+
+    def counts(self, predicates):
+        # [(facet, value, count)] plus ("total", None, matches)
+        model = self.model
+        dimensions = {
+            "genre": Genre.name, "state": model.state, "city": model.city, "seeking": self.seeking,
+            "upcoming": self.has_upcoming(),
+        }
+
+        def matching(excluded=None):
+            conditions = [condition for facet, condition in predicates.items() if facet != excluded]
+            if not conditions:
+                return db.func.count(db.distinct(model.id))
+            return db.func.count(db.distinct(db.case((db.and_(*conditions), model.id))))
+
+        def base(*columns):
+            joined = model.__table__ \
+                .outerjoin(ShowCount.__table__, db.and_(ShowCount.entity_type == self.entity_type,
+                                                        ShowCount.entity_id == model.id)) \
+                .outerjoin(self.links, self.link_column == model.id) \
+                .outerjoin(Genre.__table__, Genre.id == self.links.c.genre_id)
+            return db.select(*columns).select_from(joined)
+
+        if db.engine.dialect.name == "postgresql":
+            grouping = {facet: db.func.grouping(column) == 0 for facet, column in dimensions.items()}
+            facet = db.case(*((grouping[facet], facet) for facet in FACETS), else_="total")
+            count = db.case(*((grouping[facet], matching(facet)) for facet in FACETS), else_=matching())
+            statement = base(facet, *dimensions.values(), count) \
+                .group_by(db.func.grouping_sets(*(db.tuple_(column) for column in dimensions.values()),
+                                                db.text("()")))
+            return [(row[0], row[1 + FACETS.index(row[0])] if row[0] != "total" else None, row[-1])
+                    for row in db.session.execute(statement)]
+
+        # a Core union, executed as is: the ORM's Query.union_all wraps it in
+        # a subquery that loses the value column to the untyped NULL
+        selects = [base(db.literal(facet).label("facet"), column.label("value"), matching(facet).label("count"))
+                   .group_by(column) for facet, column in dimensions.items()]
+        total = base(db.literal("total").label("facet"), db.cast(db.null(), db.String).label("value"),
+                     matching().label("count"))
+        return [tuple(row) for row in db.session.execute(db.union_all(total, *selects))]
+
+    def browse(self, filters, after=None, limit=BROWSE_PAGE_SIZE):
+        predicates = self.predicates(filters)
+        rows = self.page(predicates, after, limit + 1)
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1].id
+        facets = {facet: {} for facet in FACETS}
+        total = 0
+        for facet, value, count in self.counts(predicates):
+            if facet == "total":
+                total = count
+            elif value is not None and count:
+                if facet in ("seeking", "upcoming"):
+                    value = "true" if value else "false"
+                facets[facet][value] = count
+        return {
+            "count": total,
+            "data": [row._asdict() for row in rows],
+            "facets": facets,
+            "next": next_cursor,
+        }
+
+
+def parse_flag(value):
+    # None when absent, raises ValueError when not a boolean
+    if value is None or value == "":
+        return None
+    value = value.lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValueError(value)
+
+
+def browse_filters(args):
+    # filters from a request's query string, see Faceted.predicates
+    return {
+        "genre": [genre for genre in args.getlist("genre") if genre],
+        "state": args.get("state"),
+        "city": args.get("city"),
+        "seeking": parse_flag(args.get("seeking")),
+        "upcoming": parse_flag(args.get("upcoming")),
+    }
+
+
+FACETED = {
+    Venue: Faceted(Venue, venue_genre, venue_genre.c.venue_id, Venue.seeking_talent, ShowCount.VENUE),
+    Artist: Faceted(Artist, artist_genre, artist_genre.c.artist_id, Artist.seeking_venue, ShowCount.ARTIST),
+}
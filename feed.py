@@ -0,0 +1,137 @@
+"""In-memory "recently listed" feed behind the home page.
+
+Each worker keeps the newest ``RECENT_LISTINGS_SIZE`` venues and artists as
+(id, name, updated_at) tuples in a ring buffer per model. The buffers are
+loaded before the first request and kept current by the create, edit and
+delete handlers, so the home page is answered without touching the database.
+
+Workers only see their own writes, so every write also stores a new
+generation token in the view cache backend. A read compares that token with
+the one the worker loaded against and reloads on a mismatch. The token never
+expires, so the buffers are only reloaded after writes. It is shared between
+processes only with the Redis backend (one GET per home page); with the
+memory backend each process holds its own token, and writes from other
+processes (``flask import``, other workers) go unseen until a restart, so
+run more than one process with ``CACHE_BACKEND = "redis"``.
+"""
+import threading
+import uuid
+from collections import deque, namedtuple
+
+from flask import current_app
+
+from cache import _MISSING
+from models import db, Venue, Artist
+from routing import primary
+
+GENERATION_KEY = "recent:generation"
+
+Listing = namedtuple("Listing", ["id", "name", "updated_at"])
+
+
+class RecentBuffer:
+    """The newest entities of one model, newest first."""
+
+    def __init__(self, size):
+        self.entries = deque(maxlen=size)
+        self.complete = False
+
+    def load(self, model):
+        # from the primary: every client reads the buffer, including ones
+        # that must see their own writes
+        with primary():
+            rows = db.session.query(model.id, model.name, model.updated_at) \
+                .order_by(model.id.desc()).limit(self.entries.maxlen).all()
+        self.entries = deque((Listing(*row) for row in rows), maxlen=self.entries.maxlen)
+        self.complete = True
+
+    def add(self, entity):
+        self.entries.appendleft(Listing(entity.id, entity.name, entity.updated_at))
+
+    def update(self, entity):
+        self.entries = deque((Listing(entity.id, entity.name, entity.updated_at) if entry.id == entity.id else entry
+                              for entry in self.entries), maxlen=self.entries.maxlen)
+
+    def discard(self, entity_id):
+        if any(entry.id == entity_id for entry in self.entries):
+            # the next newest entity is not held, so refill on the next read
+            self.complete = False
+
+
+class RecentListings:
+    """Flask extension holding the recently listed venues and artists."""
+
+    def __init__(self, app=None):
+        self._buffers = {}
+        self._generations = {}
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("RECENT_LISTINGS_SIZE", 10)
+        app.extensions["recent_listings"] = self
+        app.before_first_request(self.listings)
+
+    def _state(self):
+        app = current_app._get_current_object()
+        buffers = self._buffers.get(app)
+        if buffers is None:
+            size = app.config["RECENT_LISTINGS_SIZE"]
+            buffers = self._buffers[app] = {Venue: RecentBuffer(size), Artist: RecentBuffer(size)}
+        return app, buffers
+
+    def listings(self):
+        # (venues, artists), reloading buffers that are incomplete or were
+        # changed by another process
+        app, buffers = self._state()
+        cache = app.extensions["view_cache"]
+        with self.lock:
+            generation = cache.backend.get(GENERATION_KEY)
+            if generation is _MISSING or generation != self._generations.get(app):
+                if generation is _MISSING:
+                    generation = self._touch(cache)
+                for buffer in buffers.values():
+                    buffer.complete = False
+                self._generations[app] = generation
+            for model, buffer in buffers.items():
+                if not buffer.complete:
+                    buffer.load(model)
+            return list(buffers[Venue].entries), list(buffers[Artist].entries)
+
+    def version(self, venues, artists):
+        # (last_modified, ...) for app.conditional, from the listed entries
+        entries = venues + artists
+        return (max((entry.updated_at for entry in entries if entry.updated_at), default=None),
+                tuple(entries))
+
+    def _touch(self, cache):
+        generation = uuid.uuid4().hex
+        cache.backend.set(GENERATION_KEY, generation, expire=False)
+        return generation
+
+    def _write(self, change):
+        # applies a change to this worker's buffers and tells the others
+        app, buffers = self._state()
+        cache = app.extensions["view_cache"]
+        with self.lock:
+            if cache.backend.get(GENERATION_KEY) != self._generations.get(app):
+                # behind another process's writes as well
+                for buffer in buffers.values():
+                    buffer.complete = False
+            change(buffers)
+            self._generations[app] = self._touch(cache)
+
+    def add(self, entity):
+        self._write(lambda buffers: buffers[type(entity)].add(entity))
+
+    def update(self, entity):
+        self._write(lambda buffers: buffers[type(entity)].update(entity))
+
+    def discard(self, model, entity_id):
+        self._write(lambda buffers: buffers[model].discard(entity_id))
+
+    def touch(self):
+        # for writes that bypass the handlers, e.g. bulk imports
+        with self.lock:
+            self._touch(current_app.extensions["view_cache"])
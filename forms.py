@@ -1,7 +1,9 @@
 from datetime import datetime
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, SubmitField, TimeField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, SubmitField, TimeField, \
+    IntegerField, TextAreaField
+from wtforms.validators import DataRequired, AnyOf, URL, NumberRange
+from models import DEFAULT_SHOW_MINUTES
 
 class ShowForm(Form):
     artist_id = StringField(
@@ -15,6 +17,18 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default= datetime.today()
     )
+    duration = IntegerField(
+        'duration',
+        validators=[DataRequired(), NumberRange(min=1, max=24 * 60)],
+        default=DEFAULT_SHOW_MINUTES
+    )
+
+class ShowBatchForm(Form):
+    # one show per line: artist_id,venue_id,start_time[,duration in minutes]
+    shows = TextAreaField(
+        'shows',
+        validators=[DataRequired()]
+    )
 
 class VenueForm(Form):
     name = StringField(
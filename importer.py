@@ -0,0 +1,364 @@
+"""Bulk import of venues, artists and shows.
+
+    flask import venues venues.csv
+    flask import artists artists.jsonl --batch-size 5000
+    flask import shows shows.csv --errors rejected.csv
+
+Files are streamed row by row, either as CSV with a header line or as JSON
+lines. Genres are given as a list (JSONL) or a ``;``/``,`` separated string
+(CSV) and resolved through the process-wide ``genre_resolver`` map. Shows take
+an optional ``end_time`` and are rejected when they overlap another booking of
+their artist or venue. Valid rows
+are written in chunks of ``--batch-size``, each chunk in its own
+transaction, using COPY on Postgres and executemany elsewhere. Rows that fail
+validation, or belong to a chunk the database rejected, are reported with
+their line number instead of aborting the import.
+
+Running workers learn of the import through the same invalidations as the
+write handlers: venues and artists touch the recently listed feed and the
+name indexes, shows drop the cached pages of their venues and artists and
+the workers' booking indexes. Across processes these need the Redis cache
+backend.
+"""
+import csv
+import io
+import json
+import re
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from booking import IntervalIndex, VENUE, ARTIST, booking_index
+from cache import venue_key, artist_key
+from models import db, Venue, Artist, Show, venue_genre, artist_genre, is_available, genre_resolver, \
+    DEFAULT_SHOW_MINUTES
+from rollups import record_shows
+
+TRUE_VALUES = {"1", "true", "t", "yes", "y"}
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(path):
+    # yields (line number, row dict) without loading the whole file
+    with open(path, newline="", encoding="utf-8") as stream:
+        if path.endswith((".jsonl", ".ndjson")):
+            for line_number, line in enumerate(stream, start=1):
+                if line.strip():
+                    try:
+                        row = json.loads(line)
+                    except ValueError as error:
+                        yield line_number, RowError(f"invalid JSON: {error}")
+                        continue
+                    if not isinstance(row, dict):
+                        row = RowError("each line must be a JSON object")
+                    yield line_number, row
+        else:
+            reader = csv.DictReader(stream)
+            for row in reader:
+                yield reader.line_num, row
+
+
+def text(row, field, required=False):
+    value = row.get(field)
+    if value is not None:
+        value = str(value).strip() or None
+    if required and value is None:
+        raise RowError(f"{field} is required")
+    return value
+
+
+def boolean(row, field):
+    value = row.get(field)
+    if isinstance(value, bool) or value is None:
+        return bool(value)
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def time_of_day(row, field):
+    value = text(row, field, required=True)
+    try:
+        return time.fromisoformat(value)
+    except ValueError:
+        raise RowError(f"{field} must be a time such as 18:30, got {value!r}")
+
+
+def genre_names(row):
+    value = row.get("genres") or []
+    if isinstance(value, str):
+        value = re.split(r"[;,]", value)
+    return [name.strip() for name in value if name and name.strip()]
+
+
+class Importer:
+    """Validates rows for one table and writes them in batches."""
+
+    model = None
+    genre_table = None
+    genre_column = None
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+
+    def load(self):
+        # one-off lookups shared by every row of the import
+        pass
+
+    def prepare(self, row):
+        raise NotImplementedError
+
+    def write(self, records):
+        if self.genre_table is not None:
+            # resolved before the chunk's transaction writes anything, as new
+            # genres are committed on their own connection
+            genres = genre_resolver.resolve(name for record in records for name in record["genres"])
+            connection = db.session.connection()
+            ids = allocate_ids(connection, self.model.__table__, len(records))
+            links = []
+            for entity_id, record in zip(ids, records):
+                record["id"] = entity_id
+                genre_ids = [genres[name] for name in dict.fromkeys(record.pop("genres"))]
+                record["genre_ids"] = sorted(genre_ids)
+                links.extend({self.genre_column: entity_id, "genre_id": genre_id} for genre_id in genre_ids)
+            insert_rows(connection, self.model.__table__, records)
+            insert_rows(connection, self.genre_table, links)
+        else:
+            insert_rows(db.session.connection(), self.model.__table__, records)
+
+    def forget(self, records):
+        # called when a chunk was rolled back, so later chunks can retry the
+        # same unique values
+        pass
+
+    def touch(self):
+        # tells running workers about the rows written, once at the end
+        current_app.extensions["recent_listings"].touch()
+        current_app.extensions["name_search"].touch()
+
+
+class VenueImporter(Importer):
+    model = Venue
+    genre_table = venue_genre
+    genre_column = "venue_id"
+
+    def prepare(self, row):
+        return {
+            "name": text(row, "name", required=True),
+            "city": text(row, "city", required=True),
+            "state": text(row, "state", required=True),
+            "address": text(row, "address", required=True),
+            "phone": text(row, "phone", required=True),
+            "image_link": text(row, "image_link"),
+            "facebook_link": text(row, "facebook_link"),
+            "website_link": text(row, "website_link"),
+            "seeking_talent": boolean(row, "seeking_talent"),
+            "seeking_description": text(row, "seeking_description"),
+            "genres": genre_names(row),
+        }
+
+
+class ArtistImporter(Importer):
+    model = Artist
+    genre_table = artist_genre
+    genre_column = "artist_id"
+
+    def load(self):
+        # artists.name is unique: check in memory rather than failing a chunk
+        self.names = {name for name, in db.session.query(Artist.name)}
+
+    def prepare(self, row):
+        record = {
+            "name": text(row, "name", required=True),
+            "city": text(row, "city"),
+            "state": text(row, "state"),
+            "phone": text(row, "phone"),
+            "image_link": text(row, "image_link"),
+            "facebook_link": text(row, "facebook_link"),
+            "website_link": text(row, "website_link"),
+            "seeking_venue": boolean(row, "seeking_venue"),
+            "seeking_description": text(row, "seeking_description"),
+            "time_available_from": time_of_day(row, "time_available_from"),
+            "time_available_to": time_of_day(row, "time_available_to"),
+            "genres": genre_names(row),
+        }
+        if record["name"] in self.names:
+            raise RowError(f"artist {record['name']!r} already exists")
+        self.names.add(record["name"])
+        return record
+
+    def forget(self, records):
+        self.names.difference_update(record["name"] for record in records)
+
+
+class ShowImporter(Importer):
+    model = Show
+
+    def load(self):
+        self.venue_ids = {venue_id for venue_id, in db.session.query(Venue.id)}
+        self.artists = {
+            artist_id: (available_from, available_to)
+            for artist_id, available_from, available_to in
+            db.session.query(Artist.id, Artist.time_available_from, Artist.time_available_to)
+        }
+        # bookings of every venue and artist, including rows imported so far
+        self.bookings = defaultdict(IntervalIndex)
+        self.written = set()
+        for venue_id, artist_id, start_time, end_time, show_id in \
+                db.session.query(Show.venue_id, Show.artist_id, Show.start_time, Show.end_time, Show.id):
+            self.bookings[VENUE, venue_id].add(start_time, end_time, show_id)
+            self.bookings[ARTIST, artist_id].add(start_time, end_time, show_id)
+
+    def prepare(self, row):
+        artist_id, venue_id = text(row, "artist_id", required=True), text(row, "venue_id", required=True)
+        if not (artist_id.isdigit() and venue_id.isdigit()):
+            raise RowError("artist_id and venue_id must be integers")
+        artist_id, venue_id = int(artist_id), int(venue_id)
+        value = text(row, "start_time", required=True)
+        try:
+            start_time = datetime.fromisoformat(value)
+        except ValueError:
+            raise RowError(f"start_time must be an ISO date and time, got {value!r}")
+        value = text(row, "end_time")
+        try:
+            end_time = datetime.fromisoformat(value) if value else start_time + timedelta(minutes=DEFAULT_SHOW_MINUTES)
+        except ValueError:
+            raise RowError(f"end_time must be an ISO date and time, got {value!r}")
+        if end_time <= start_time:
+            raise RowError("end_time must be after start_time")
+        availability = self.artists.get(artist_id)
+        if availability is None:
+            raise RowError(f"artist {artist_id} does not exist")
+        if venue_id not in self.venue_ids:
+            raise RowError(f"venue {venue_id} does not exist")
+        if not is_available(*availability, start_time.time()):
+            raise RowError(f"artist {artist_id} will not be available at {start_time.time()}")
+        for key in ((ARTIST, artist_id), (VENUE, venue_id)):
+            if self.bookings[key].conflict(start_time, end_time) is not None:
+                raise RowError(f"{key[0]} {key[1]} is already booked between {start_time} and {end_time}")
+        for key in ((ARTIST, artist_id), (VENUE, venue_id)):
+            self.bookings[key].add(start_time, end_time, None)
+        return {"artist_id": artist_id, "venue_id": venue_id, "start_time": start_time, "end_time": end_time}
+
+    def write(self, records):
+        super().write(records)
+        record_shows((record["venue_id"], record["artist_id"], record["start_time"]) for record in records)
+        self.written.update((record["venue_id"], record["artist_id"]) for record in records)
+
+    def forget(self, records):
+        for record in records:
+            self.bookings[ARTIST, record["artist_id"]].discard(record["start_time"])
+            self.bookings[VENUE, record["venue_id"]].discard(record["start_time"])
+
+    def touch(self):
+        # the pages listing the new shows, and every worker's bookings
+        keys = {venue_key(venue_id) for venue_id, _ in self.written}
+        keys.update(artist_key(artist_id) for _, artist_id in self.written)
+        current_app.extensions["view_cache"].delete(*keys)
+        booking_index.touch()
+
+
+IMPORTERS = {"venues": VenueImporter, "artists": ArtistImporter, "shows": ShowImporter}
+
+
+def allocate_ids(connection, table, count):
+    # ids are reserved up front so genre links can be written in the same
+    # batch without RETURNING
+    if connection.dialect.name == "postgresql":
+        rows = connection.execute(
+            db.text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :count)"),
+            {"table": table.name, "count": count})
+        return [entity_id for entity_id, in rows]
+    # a no-op write first takes SQLite's write lock, held until the chunk's
+    # transaction ends, so no other writer can take these ids meanwhile
+    connection.execute(table.update().where(db.false()).values(id=table.c.id))
+    start = connection.execute(db.select(db.func.coalesce(db.func.max(table.c.id), 0))).scalar() + 1
+    return list(range(start, start + count))
+
+
+def copy_value(value):
+    # COPY reads arrays as {1,2} literals, not Python's [1, 2]
+    if isinstance(value, list):
+        return "{" + ",".join(str(item) for item in value) + "}"
+    return value
+
+
+def insert_rows(connection, table, records):
+    if not records:
+        return
+    if connection.dialect.name == "postgresql":
+        columns = list(records[0])
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for record in records:
+            writer.writerow([copy_value(record[column]) for column in columns])
+        buffer.seek(0)
+        with connection.connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    else:
+        connection.execute(table.insert(), records)
+
+
+def run_import(kind, path, batch_size=1000):
+    # returns (imported count, [(line number, message)])
+    importer = IMPORTERS[kind](batch_size)
+    importer.load()
+    db.session.commit()
+    imported = 0
+    errors = []
+    lines, records = [], []
+
+    def flush():
+        nonlocal imported
+        try:
+            importer.write(records)
+            db.session.commit()
+        except Exception as error:
+            db.session.rollback()
+            errors.extend((line, f"batch rejected by the database: {error}") for line in lines)
+            importer.forget(records)
+        else:
+            imported += len(records)
+        lines.clear()
+        records.clear()
+
+    for line, row in read_rows(path):
+        try:
+            if isinstance(row, RowError):
+                raise row
+            records.append(importer.prepare(row))
+            lines.append(line)
+        except RowError as error:
+            errors.append((line, str(error)))
+        if len(records) >= batch_size:
+            flush()
+    if records:
+        flush()
+    if imported:
+        importer.touch()
+    return imported, errors
+
+
+@click.command("import")
+@click.argument("kind", type=click.Choice(sorted(IMPORTERS)))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--batch-size", default=1000, show_default=True, help="Rows per transaction.")
+@click.option("--errors", "error_path", type=click.Path(dir_okay=False),
+              help="Write rejected rows as CSV (line, error) instead of printing them.")
+@with_appcontext
+def import_command(kind, path, batch_size, error_path):
+    """Bulk load venues, artists or shows from a CSV or JSONL file."""
+    imported, errors = run_import(kind, path, batch_size)
+    if error_path:
+        with open(error_path, "w", newline="", encoding="utf-8") as stream:
+            writer = csv.writer(stream)
+            writer.writerow(["line", "error"])
+            writer.writerows(errors)
+    else:
+        for line, message in errors:
+            click.echo(f"line {line}: {message}", err=True)
+    click.echo(f"Imported {imported} {kind}, rejected {len(errors)}.")
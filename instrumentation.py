@@ -0,0 +1,122 @@
+"""Per-request SQL instrumentation.
+
+Every request gets a ``Server-Timing`` header with the number of statements,
+the time spent in the database and the total time of the request. A
+``SQL_SAMPLE_RATE`` share of requests, or every request when
+``SQL_LOG_ALL_REQUESTS`` is set, also collect a fingerprint of each statement (whitespace and bind lists normalised) so that
+a SELECT repeated more than ``SQL_N_PLUS_ONE_THRESHOLD`` times is logged as a
+likely N+1, and end with one JSON log line describing the request.
+
+Streamed responses (the ``/api/v1`` NDJSON listings) run their queries after
+the headers are sent, so they get neither the header nor the log line.
+"""
+import json
+import random
+import re
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_WHITESPACE = re.compile(r"\s+")
+_BIND_LIST = re.compile(r"\(\s*(?:\?|%\(\w+\)s|%s)(?:\s*,\s*(?:\?|%\(\w+\)s|%s))*\s*\)")
+_NUMBER = re.compile(r"\b\d+\b")
+
+
+def fingerprint(statement):
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    statement = _BIND_LIST.sub("(...)", statement)
+    return _NUMBER.sub("N", statement)
+
+
+class SQLStats:
+    def __init__(self, sampled):
+        self.sampled = sampled
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        if self.sampled:
+            self.fingerprints[fingerprint(statement)] += 1
+
+    def repeated(self, threshold):
+        return [(statement, count) for statement, count in self.fingerprints.most_common()
+                if count > threshold and statement.upper().startswith("SELECT")]
+
+
+def _record(statement, started):
+    if has_request_context():
+        stats = g.get("sql_stats")
+        if stats is not None:
+            stats.record(statement, time.perf_counter() - started)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append((context, time.perf_counter()))
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _, started = conn.info["query_started"].pop()
+    _record(statement, started)
+
+
+def _handle_error(exception_context):
+    # a failed statement never reaches after_cursor_execute; errors raised
+    # before the cursor ran pushed nothing, hence the context check
+    connection = exception_context.connection
+    stack = connection.info.get("query_started") if connection is not None else None
+    if stack and stack[-1][0] is exception_context.execution_context:
+        _, started = stack.pop()
+        _record(exception_context.statement, started)
+
+
+class SQLInstrumentation:
+    """Flask extension wiring the engine events to the request cycle."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("SQL_SAMPLE_RATE", 0.01)
+        app.config.setdefault("SQL_LOG_ALL_REQUESTS", False)
+        app.config.setdefault("SQL_N_PLUS_ONE_THRESHOLD", 5)
+        app.extensions["sql_instrumentation"] = self
+        if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+            event.listen(Engine, "handle_error", _handle_error)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def _start(self):
+        config = current_app.config
+        sampled = config["SQL_LOG_ALL_REQUESTS"] or random.random() < config["SQL_SAMPLE_RATE"]
+        g.sql_stats = SQLStats(sampled)
+        g.request_started = time.perf_counter()
+
+    def _finish(self, response):
+        stats = g.pop("sql_stats", None)
+        if stats is None or response.is_streamed:
+            return response
+        total = (time.perf_counter() - g.pop("request_started")) * 1000
+        database = stats.duration * 1000
+        response.headers.add("Server-Timing", f'db;dur={database:.2f};desc="{stats.count} queries"')
+        response.headers.add("Server-Timing", f"app;dur={total:.2f}")
+        if stats.sampled:
+            repeated = stats.repeated(current_app.config["SQL_N_PLUS_ONE_THRESHOLD"])
+            for statement, count in repeated:
+                current_app.logger.warning("Likely N+1 on %s %s: %d x %s", request.method, request.path, count,
+                                           statement)
+            current_app.logger.info(json.dumps({
+                "event": "request", "method": request.method, "path": request.path,
+                "endpoint": request.endpoint, "status": response.status_code, "duration_ms": round(total, 2),
+                "db_ms": round(database, 2), "queries": stats.count, "distinct_queries": len(stats.fingerprints),
+                "n_plus_one": [{"statement": statement, "count": count} for statement, count in repeated],
+            }))
+        return response
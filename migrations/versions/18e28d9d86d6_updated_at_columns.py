@@ -0,0 +1,29 @@
+"""updated_at columns
+
+Revision ID: 18e28d9d86d6
+Revises: 5425d744fed9
+Create Date: 2026-10-17 16:41:53.880214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '18e28d9d86d6'
+down_revision = '5425d744fed9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venues', 'artists', 'shows'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'),
+                                          nullable=False))
+
+
+def downgrade():
+    for table in ('shows', 'artists', 'venues'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('updated_at')
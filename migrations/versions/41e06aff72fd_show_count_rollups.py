@@ -0,0 +1,50 @@
+"""show count rollups
+
+Revision ID: 41e06aff72fd
+Revises: 18e28d9d86d6
+Create Date: 2026-10-17 17:02:36.408913
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '41e06aff72fd'
+down_revision = '18e28d9d86d6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('show_counts',
+    sa.Column('entity_type', sa.String(length=10), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('upcoming', sa.Integer(), nullable=False),
+    sa.Column('past', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('entity_type', 'entity_id')
+    )
+    rollup_state = op.create_table('rollup_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rolled_to', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # backfill the counters split at the moment of the upgrade
+    now = datetime.now()
+    op.bulk_insert(rollup_state, [{'id': 1, 'rolled_to': now}])
+    for entity_type, column in (('venue', 'venue_id'), ('artist', 'artist_id')):
+        op.get_bind().execute(sa.text(
+            'INSERT INTO show_counts (entity_type, entity_id, upcoming, past) '
+            f'SELECT :entity_type, {column}, '
+            'SUM(CASE WHEN start_time > :now THEN 1 ELSE 0 END), '
+            'SUM(CASE WHEN start_time <= :now THEN 1 ELSE 0 END) '
+            f'FROM shows GROUP BY {column}'
+        ), {'entity_type': entity_type, 'now': now})
+
+
+def downgrade():
+    op.drop_table('rollup_state')
+    op.drop_table('show_counts')
@@ -0,0 +1,34 @@
+"""name trigram indexes
+
+Revision ID: 5425d744fed9
+Revises: fb976df4e050
+Create Date: 2026-10-17 16:10:12.204518
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5425d744fed9'
+down_revision = 'fb976df4e050'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # pg_trgm only exists on Postgres; other databases use the in-process
+    # n-gram index from search.py
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_venues_name_trgm', 'venues', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_artists_name_trgm', 'artists', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_artists_name_trgm', table_name='artists')
+    op.drop_index('ix_venues_name_trgm', table_name='venues')
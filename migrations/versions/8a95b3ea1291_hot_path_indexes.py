@@ -0,0 +1,37 @@
+"""hot path indexes
+
+Revision ID: 8a95b3ea1291
+Revises: 41e06aff72fd
+Create Date: 2026-10-17 17:31:08.662047
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8a95b3ea1291'
+down_revision = '41e06aff72fd'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_shows_start_time_id', 'shows', ['start_time', 'id'], unique=False)
+    op.create_index('ix_shows_updated_at', 'shows', ['updated_at'], unique=False)
+    op.create_index('ix_venues_state_city', 'venues', ['state', 'city'], unique=False)
+    op.create_index('ix_venues_updated_at', 'venues', ['updated_at'], unique=False)
+    op.create_index('ix_artists_state_city', 'artists', ['state', 'city'], unique=False)
+    op.create_index('ix_artists_updated_at', 'artists', ['updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_artists_updated_at', table_name='artists')
+    op.drop_index('ix_artists_state_city', table_name='artists')
+    op.drop_index('ix_venues_updated_at', table_name='venues')
+    op.drop_index('ix_venues_state_city', table_name='venues')
+    op.drop_index('ix_shows_updated_at', table_name='shows')
+    op.drop_index('ix_shows_start_time_id', table_name='shows')
+    op.drop_index('ix_shows_artist_id_start_time', table_name='shows')
+    op.drop_index('ix_shows_venue_id_start_time', table_name='shows')
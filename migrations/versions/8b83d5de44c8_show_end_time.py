@@ -0,0 +1,43 @@
+"""show end time and double-booking constraints
+
+Revision ID: 8b83d5de44c8
+Revises: 8a95b3ea1291
+Create Date: 2026-10-17 18:02:44.319508
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b83d5de44c8'
+down_revision = '8a95b3ea1291'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('shows', sa.Column('end_time', sa.DateTime(), nullable=True))
+    # existing shows get the default two hour slot
+    if op.get_context().dialect.name == 'postgresql':
+        op.execute("UPDATE shows SET end_time = start_time + interval '120 minutes'")
+    else:
+        op.execute("UPDATE shows SET end_time = datetime(start_time, '+120 minutes')")
+    with op.batch_alter_table('shows') as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=False)
+
+    if op.get_context().dialect.name == 'postgresql':
+        # fails if the shows table already holds overlapping bookings; resolve
+        # those before upgrading
+        op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+        for column in ('artist_id', 'venue_id'):
+            op.execute(f'ALTER TABLE shows ADD CONSTRAINT shows_{column}_no_overlap '
+                       f'EXCLUDE USING gist ({column} WITH =, tsrange(start_time, end_time) WITH &&)')
+
+
+def downgrade():
+    if op.get_context().dialect.name == 'postgresql':
+        for column in ('artist_id', 'venue_id'):
+            op.execute(f'ALTER TABLE shows DROP CONSTRAINT shows_{column}_no_overlap')
+    with op.batch_alter_table('shows') as batch_op:
+        batch_op.drop_column('end_time')
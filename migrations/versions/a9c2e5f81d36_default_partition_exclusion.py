@@ -0,0 +1,32 @@
+"""default partition exclusion
+
+Revision ID: a9c2e5f81d36
+Revises: e7a4c9f2b6d3
+Create Date: 2026-10-17 18:12:05.418273
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9c2e5f81d36'
+down_revision = 'e7a4c9f2b6d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # shows outside the created months land in shows_pdefault, which the
+    # show partitions migration left without the double-booking constraints
+    if op.get_context().dialect.name != 'postgresql':
+        return
+    for column in ('artist_id', 'venue_id'):
+        op.execute(f'ALTER TABLE shows_pdefault ADD CONSTRAINT shows_pdefault_{column}_no_overlap '
+                   f'EXCLUDE USING gist ({column} WITH =, tsrange(start_time, end_time) WITH &&)')
+
+
+def downgrade():
+    if op.get_context().dialect.name != 'postgresql':
+        return
+    for column in ('artist_id', 'venue_id'):
+        op.execute(f'ALTER TABLE shows_pdefault DROP CONSTRAINT shows_pdefault_{column}_no_overlap')
@@ -0,0 +1,48 @@
+"""cascading deletes
+
+Revision ID: c3f1a2d7e9b4
+Revises: 8b83d5de44c8
+Create Date: 2026-10-17 19:12:05.381260
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f1a2d7e9b4'
+down_revision = '8b83d5de44c8'
+branch_labels = None
+depends_on = None
+
+# (table, column, referred table) of the foreign keys that cascade
+CASCADES = [
+    ('shows', 'venue_id', 'venues'),
+    ('shows', 'artist_id', 'artists'),
+    ('venue_genre', 'venue_id', 'venues'),
+    ('artist_genre', 'artist_id', 'artists'),
+]
+
+# names for the unnamed foreign keys SQLite reflects during batch mode
+NAMING_CONVENTION = {'fk': '%(table_name)s_%(column_0_name)s_fkey'}
+
+
+def replace_foreign_keys(ondelete):
+    # the initial schema left the constraints unnamed; Postgres called them
+    # <table>_<column>_fkey, which the naming convention reproduces
+    for table, column, referred in CASCADES:
+        name = f'{table}_{column}_fkey'
+        if op.get_context().dialect.name == 'postgresql':
+            op.drop_constraint(name, table, type_='foreignkey')
+            op.create_foreign_key(name, table, referred, [column], ['id'], ondelete=ondelete)
+        else:
+            with op.batch_alter_table(table, naming_convention=NAMING_CONVENTION) as batch_op:
+                batch_op.drop_constraint(name, type_='foreignkey')
+                batch_op.create_foreign_key(name, referred, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    replace_foreign_keys('CASCADE')
+
+
+def downgrade():
+    replace_foreign_keys(None)
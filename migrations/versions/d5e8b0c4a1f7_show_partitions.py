@@ -0,0 +1,127 @@
+"""show partitions
+
+Revision ID: d5e8b0c4a1f7
+Revises: c3f1a2d7e9b4
+Create Date: 2026-10-17 19:48:31.904125
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5e8b0c4a1f7'
+down_revision = 'c3f1a2d7e9b4'
+branch_labels = None
+depends_on = None
+
+COLUMNS = 'id, artist_id, venue_id, start_time, end_time, updated_at'
+INDEXES = [('venue_id', 'start_time'), ('artist_id', 'start_time')]
+HOT_INDEXES = INDEXES + [('start_time', 'id'), ('updated_at',)]
+MONTHS_AHEAD = 12
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partitioned_table(name, id_default):
+    return (f'CREATE TABLE {name} ('
+            f'id integer NOT NULL{id_default}, '
+            f'artist_id integer NOT NULL, '
+            f'venue_id integer NOT NULL, '
+            f'start_time timestamp without time zone NOT NULL, '
+            f'end_time timestamp without time zone NOT NULL, '
+            f'updated_at timestamp without time zone NOT NULL DEFAULT CURRENT_TIMESTAMP, '
+            f'CONSTRAINT {name}_pkey PRIMARY KEY (id, start_time), '
+            f'CONSTRAINT {name}_artist_id_fkey FOREIGN KEY (artist_id) REFERENCES artists (id) ON DELETE CASCADE, '
+            f'CONSTRAINT {name}_venue_id_fkey FOREIGN KEY (venue_id) REFERENCES venues (id) ON DELETE CASCADE'
+            f') PARTITION BY RANGE (start_time)')
+
+
+def create_indexes(table, indexes):
+    for columns in indexes:
+        op.execute(f'CREATE INDEX ix_{table}_{"_".join(columns)} ON {table} ({", ".join(columns)})')
+
+
+def upgrade():
+    if op.get_context().dialect.name != 'postgresql':
+        # only Postgres partitions; elsewhere the archive stays an empty table
+        op.create_table('shows_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('artist_id', sa.Integer(), nullable=False),
+        sa.Column('venue_id', sa.Integer(), nullable=False),
+        sa.Column('start_time', sa.DateTime(), nullable=False),
+        sa.Column('end_time', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['artist_id'], ['artists.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['venue_id'], ['venues.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+        )
+        for columns in INDEXES:
+            op.create_index(f'ix_shows_archive_{"_".join(columns)}', 'shows_archive', list(columns), unique=False)
+        return
+
+    # the old table gives up its names, then its rows, to the partitioned one
+    op.execute('ALTER TABLE shows RENAME TO shows_unpartitioned')
+    op.execute('ALTER INDEX shows_pkey RENAME TO shows_unpartitioned_pkey')
+    for column in ('artist_id', 'venue_id'):
+        op.execute(f'ALTER TABLE shows_unpartitioned DROP CONSTRAINT shows_{column}_no_overlap')
+    for columns in HOT_INDEXES:
+        op.execute(f'DROP INDEX ix_shows_{"_".join(columns)}')
+
+    op.execute(partitioned_table('shows', " DEFAULT nextval('shows_id_seq')"))
+    op.execute('CREATE TABLE shows_pdefault PARTITION OF shows DEFAULT')
+    create_indexes('shows', HOT_INDEXES)
+
+    # a partition per month from the oldest show to a year ahead
+    oldest = op.get_bind().execute(sa.text('SELECT min(start_time) FROM shows_unpartitioned')).scalar()
+    now = datetime.now()
+    month = datetime((oldest or now).year, (oldest or now).month, 1)
+    last = add_months(datetime(now.year, now.month, 1), MONTHS_AHEAD)
+    while month <= last:
+        name = f'shows_p{month:%Y_%m}'
+        op.execute(f"CREATE TABLE {name} PARTITION OF shows "
+                   f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')")
+        for column in ('artist_id', 'venue_id'):
+            op.execute(f'ALTER TABLE {name} ADD CONSTRAINT {name}_{column}_no_overlap '
+                       f'EXCLUDE USING gist ({column} WITH =, tsrange(start_time, end_time) WITH &&)')
+        month = add_months(month, 1)
+
+    op.execute(f'INSERT INTO shows ({COLUMNS}) SELECT {COLUMNS} FROM shows_unpartitioned')
+    op.execute('ALTER SEQUENCE shows_id_seq OWNED BY shows.id')
+    op.execute('DROP TABLE shows_unpartitioned')
+
+    op.execute(partitioned_table('shows_archive', ''))
+    create_indexes('shows_archive', INDEXES)
+
+
+def downgrade():
+    if op.get_context().dialect.name != 'postgresql':
+        op.drop_table('shows_archive')
+        return
+
+    # archived shows come back into one plain table
+    op.execute('ALTER TABLE shows RENAME TO shows_partitioned')
+    op.execute('ALTER INDEX shows_pkey RENAME TO shows_partitioned_pkey')
+    for columns in HOT_INDEXES:
+        op.execute(f'DROP INDEX ix_shows_{"_".join(columns)}')
+    op.execute("CREATE TABLE shows ("
+               "id integer NOT NULL DEFAULT nextval('shows_id_seq') PRIMARY KEY, "
+               "artist_id integer NOT NULL REFERENCES artists (id) ON DELETE CASCADE, "
+               "venue_id integer NOT NULL REFERENCES venues (id) ON DELETE CASCADE, "
+               "start_time timestamp without time zone NOT NULL, "
+               "end_time timestamp without time zone NOT NULL, "
+               "updated_at timestamp without time zone NOT NULL DEFAULT CURRENT_TIMESTAMP)")
+    op.execute(f'INSERT INTO shows ({COLUMNS}) SELECT {COLUMNS} FROM shows_partitioned '
+               f'UNION ALL SELECT {COLUMNS} FROM shows_archive')
+    op.execute('ALTER SEQUENCE shows_id_seq OWNED BY shows.id')
+    op.execute('DROP TABLE shows_partitioned')
+    op.execute('DROP TABLE shows_archive')
+    create_indexes('shows', HOT_INDEXES)
+    for column in ('artist_id', 'venue_id'):
+        op.execute(f'ALTER TABLE shows ADD CONSTRAINT shows_{column}_no_overlap '
+                   f'EXCLUDE USING gist ({column} WITH =, tsrange(start_time, end_time) WITH &&)')
@@ -0,0 +1,45 @@
+"""genre id arrays
+
+Revision ID: e7a4c9f2b6d3
+Revises: d5e8b0c4a1f7
+Create Date: 2026-10-17 20:21:47.126530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a4c9f2b6d3'
+down_revision = 'd5e8b0c4a1f7'
+branch_labels = None
+depends_on = None
+
+# (table, link table, link column)
+ENTITIES = [('venues', 'venue_genre', 'venue_id'), ('artists', 'artist_genre', 'artist_id')]
+
+
+def upgrade():
+    postgres = op.get_context().dialect.name == 'postgresql'
+    for table, links, column in ENTITIES:
+        if postgres:
+            op.add_column(table, sa.Column('genre_ids', postgresql.ARRAY(sa.Integer()), nullable=False,
+                                           server_default='{}'))
+            op.execute(f'UPDATE {table} SET genre_ids = links.genre_ids FROM ('
+                       f'SELECT {column}, array_agg(genre_id ORDER BY genre_id) AS genre_ids '
+                       f'FROM {links} GROUP BY {column}) AS links WHERE links.{column} = {table}.id')
+            op.create_index(f'ix_{table}_genre_ids', table, ['genre_ids'], unique=False, postgresql_using='gin')
+        else:
+            op.add_column(table, sa.Column('genre_ids', sa.JSON(), nullable=False, server_default='[]'))
+            # no index: a B-tree over a JSON column answers none of the queries
+            op.execute(f'UPDATE {table} SET genre_ids = (SELECT json_group_array(genre_id) FROM ('
+                       f'SELECT genre_id FROM {links} WHERE {column} = {table}.id ORDER BY genre_id))')
+
+
+def downgrade():
+    for table, _, _ in ENTITIES:
+        if op.get_context().dialect.name == 'postgresql':
+            op.drop_index(f'ix_{table}_genre_ids', table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('genre_ids')
@@ -1,11 +1,58 @@
-from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+import sqlite3
+import threading
 
-db = SQLAlchemy()
+from datetime import datetime, timedelta
+from sqlalchemy import event, DDL
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import make_transient_to_detached
+
+from routing import RoutingSQLAlchemy
+
+db = RoutingSQLAlchemy()
+
+DEFAULT_SHOW_MINUTES = 120
+
+# sorted genre ids: an integer array (GIN indexed) on Postgres, JSON elsewhere
+GENRE_IDS = db.JSON().with_variant(postgresql.ARRAY(db.Integer), "postgresql")
+
+
+def split_shows(rows, now):
+    # partitions show rows into (upcoming, past) against a single `now` so
+    # lists and counts always agree
+    upcoming, past = [], []
+    for row in rows:
+        if row.start_time > now:
+            upcoming.append(row)
+        else:
+            past.append(row)
+    return upcoming, past
+
+
+def is_available(time_available_from, time_available_to, time):
+    # whether an artist's daily availability window covers `time`
+    return time_available_from <= time < time_available_to
+
+
+def default_end_time(context):
+    return context.get_current_parameters()["start_time"] + timedelta(minutes=DEFAULT_SHOW_MINUTES)
+
+
+def version_of(row):
+    # (last_modified, *row) for a row of version aggregates; last_modified
+    # is the newest datetime in it, None when nothing exists yet
+    stamps = [value for value in row if isinstance(value, datetime)]
+    return (max(stamps) if stamps else None,) + tuple(row)
 
 
 class Venue(db.Model):
     __tablename__ = "venues"
+    __table_args__ = (
+        db.Index("ix_venues_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+        db.Index("ix_venues_state_city", "state", "city"),
+        db.Index("ix_venues_updated_at", "updated_at"),
+        db.Index("ix_venues_genre_ids", "genre_ids", postgresql_using="gin"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
     city = db.Column(db.String(120), nullable=False)
@@ -17,35 +64,86 @@ class Venue(db.Model):
     website_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean)
     seeking_description = db.Column(db.String)
-    shows = db.relationship("Show", backref="venue", lazy=True, cascade="all, delete-orphan")
-    genres = db.relationship("Genre", secondary="venue_genre", lazy="subquery",
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, server_default=db.text("CURRENT_TIMESTAMP"))
+    # the shows and genre links go with the venue through ON DELETE CASCADE,
+    # so deleting a venue never loads its history into the session
+    shows = db.relationship("Show", backref="venue", lazy=True, cascade="all, delete-orphan", passive_deletes=True)
+    # the venue_genre links stay the source of truth; genre_ids mirrors them
+    # on the row so reads and genre filters need no join
+    genre_ids = db.Column(GENRE_IDS, nullable=False, default=list)
+    genres = db.relationship("Genre", secondary="venue_genre", lazy=True, passive_deletes=True,
                              backref=db.backref('venues', lazy=True))
 
     def __repr__(self):
         return f"<Venue {self.id}: {self.name}>"
 
-    def upcoming_shows(self):
-        # return [show for show in self.shows if show.start_time > datetime.now()]
-        return db.session.query(Show).filter(Show.venue_id == self.id, Show.start_time > datetime.now()).all()
+    @classmethod
+    def area_listing(cls):
+        # one row per venue with its upcoming show count from the rollup,
+        # ordered so that venues in the same city/state are adjacent
+        return cls.area_listing_query(versioned=True).all()
+
+    @classmethod
+    def area_listing_query(cls, versioned=False):
+        # versioned adds updated_at for the cached venue cards
+        upcoming = db.func.coalesce(ShowCount.upcoming, 0)
+        query = db.session.query(cls.id, cls.name, cls.city, cls.state, upcoming.label("num_upcoming_shows")) \
+            .outerjoin(ShowCount, db.and_(ShowCount.entity_type == ShowCount.VENUE, ShowCount.entity_id == cls.id)) \
+            .order_by(cls.state.asc(), cls.city.asc(), cls.id.asc())
+        return query.add_columns(cls.updated_at) if versioned else query
+
+    @classmethod
+    def page_version(cls, venue_id):
+        # version of the venue page without loading its shows: its own and
+        # its shows'/artists' updated_at, the newest show that has moved
+        # into the past and the show count. None if the venue doesn't exist
+        row = cls.page_version_query(venue_id).first()
+        return version_of(row) if row else None
+
+    @classmethod
+    def page_version_query(cls, venue_id):
+        # over both tiers, like show_schedule_query
+        now = datetime.now()
+        shows = all_shows("id", "start_time", "venue_id", "artist_id", "updated_at")
+        return db.session.query(cls.updated_at, db.func.max(shows.c.updated_at), db.func.max(Artist.updated_at),
+                                db.func.max(db.case((shows.c.start_time <= now, shows.c.start_time))),
+                                db.func.count(shows.c.id)) \
+            .outerjoin(shows, shows.c.venue_id == cls.id) \
+            .outerjoin(Artist, Artist.id == shows.c.artist_id) \
+            .filter(cls.id == venue_id) \
+            .group_by(cls.id, cls.updated_at)
 
-    def past_shows(self):
-        # return [show for show in self.shows if show.start_time <= datetime.now()]
-        return db.session.query(Show).filter(Show.venue_id == self.id, Show.start_time <= datetime.now()).all()
+    def show_schedule(self, now=None):
+        # every show at this venue with its artist columns in one query,
+        # returned as (upcoming, past)
+        return split_shows(self.show_schedule_query(self.id).all(), now or datetime.now())
+
+    @classmethod
+    def show_schedule_query(cls, venue_id):
+        # past shows may have been archived, so both tiers are read
+        shows = all_shows("id", "start_time", "venue_id", "artist_id")
+        return db.session.query(shows.c.id, shows.c.start_time, shows.c.artist_id, Artist.name.label("artist_name"),
+                                Artist.image_link.label("artist_image_link")) \
+            .join(Artist, Artist.id == shows.c.artist_id) \
+            .filter(shows.c.venue_id == venue_id) \
+            .order_by(shows.c.start_time.asc(), shows.c.id.asc())
 
     def upcoming_show_count(self):
-        return db.session.query(Show).filter(Show.venue_id == self.id, Show.start_time > datetime.now()).count()
+        return ShowCount.lookup(ShowCount.VENUE, self.id)[0]
 
     def past_shows_count(self):
-        return db.session.query(Show).filter(Show.venue_id == self.id, Show.start_time <= datetime.now()).count()
+        return ShowCount.lookup(ShowCount.VENUE, self.id)[1]
 
 
 artist_genre = db.Table("artist_genre",
-                        db.Column("artist_id", db.Integer, db.ForeignKey("artists.id"), primary_key=True),
+                        db.Column("artist_id", db.Integer, db.ForeignKey("artists.id", ondelete="CASCADE"),
+                                  primary_key=True),
                         db.Column("genre_id", db.Integer, db.ForeignKey("genres.id"), primary_key=True)
                         )
 
 venue_genre = db.Table("venue_genre",
-                       db.Column("venue_id", db.Integer, db.ForeignKey("venues.id"), primary_key=True),
+                       db.Column("venue_id", db.Integer, db.ForeignKey("venues.id", ondelete="CASCADE"),
+                                 primary_key=True),
                        db.Column("genre_id", db.Integer, db.ForeignKey("genres.id"), primary_key=True)
                        )
 
@@ -60,8 +158,89 @@ class Genre(db.Model):
         return f"<Genre {self.id}>"
 
 
+class GenreResolver:
+    """Maps genre names to ids, creating missing genres.
+
+    The genre vocabulary is small and nearly static, so resolved ids are kept
+    in a process-local map and a known genre costs no query at all. Unknown
+    names are looked up with a single IN query and the rest are inserted with
+    ON CONFLICT DO NOTHING, so concurrent requests adding the same genre
+    don't collide on genres.name. Inserts are committed on their own
+    connection: a rolled back request must not leave ids in the map that
+    were never committed.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.lock = threading.Lock()
+
+    def resolve(self, names):
+        # returns {name: id} for every name
+        names = list(dict.fromkeys(names))
+        missing = [name for name in names if name not in self.ids]
+        if missing:
+            self._load(missing)
+        return {name: self.ids[name] for name in names}
+
+    def _load(self, names):
+        with db.session.no_autoflush:
+            found = dict(db.session.execute(db.select(Genre.name, Genre.id).where(Genre.name.in_(names))).all())
+        new = [name for name in names if name not in found]
+        if new:
+            with db.engine.begin() as connection:
+                if connection.dialect.name == "postgresql":
+                    statement = postgresql.insert(Genre.__table__).on_conflict_do_nothing(index_elements=["name"])
+                    found.update(connection.execute(statement.returning(Genre.name, Genre.id),
+                                                    [{"name": name} for name in new]).all())
+                else:
+                    statement = sqlite.insert(Genre.__table__).on_conflict_do_nothing(index_elements=["name"]) \
+                        if connection.dialect.name == "sqlite" else Genre.__table__.insert()
+                    connection.execute(statement, [{"name": name} for name in new])
+                # names another request inserted first are not returned
+                lost = [name for name in new if name not in found]
+                if lost:
+                    found.update(connection.execute(db.select(Genre.name, Genre.id)
+                                                    .where(Genre.name.in_(lost))).all())
+        with self.lock:
+            self.ids.update(found)
+
+    def names(self, genre_ids):
+        # genre names for ids, in the order given
+        with self.lock:
+            known = {genre_id: name for name, genre_id in self.ids.items()}
+        missing = [genre_id for genre_id in genre_ids if genre_id not in known]
+        if missing:
+            found = dict(db.session.execute(db.select(Genre.name, Genre.id).where(Genre.id.in_(missing))).all())
+            with self.lock:
+                self.ids.update(found)
+            known.update((genre_id, name) for name, genre_id in found.items())
+        return [known[genre_id] for genre_id in genre_ids if genre_id in known]
+
+    def genres(self, names):
+        # Genre instances for the session without loading them
+        instances = []
+        for name, genre_id in self.resolve(names).items():
+            genre = Genre(id=genre_id, name=name)
+            make_transient_to_detached(genre)
+            instances.append(db.session.merge(genre, load=False))
+        return instances
+
+    def clear(self):
+        with self.lock:
+            self.ids.clear()
+
+
+genre_resolver = GenreResolver()
+
+
 class Artist(db.Model):
     __tablename__ = "artists"
+    __table_args__ = (
+        db.Index("ix_artists_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+        db.Index("ix_artists_state_city", "state", "city"),
+        db.Index("ix_artists_updated_at", "updated_at"),
+        db.Index("ix_artists_genre_ids", "genre_ids", postgresql_using="gin"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False, unique=True)
     city = db.Column(db.String(120))
@@ -72,8 +251,10 @@ class Artist(db.Model):
     website_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean)
     seeking_description = db.Column(db.String)
-    shows = db.relationship("Show", backref="artist", lazy=True)
-    genres = db.relationship("Genre", secondary=artist_genre, lazy="subquery",
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, server_default=db.text("CURRENT_TIMESTAMP"))
+    shows = db.relationship("Show", backref="artist", lazy=True, cascade="all, delete", passive_deletes=True)
+    genre_ids = db.Column(GENRE_IDS, nullable=False, default=list)
+    genres = db.relationship("Genre", secondary=artist_genre, lazy=True, passive_deletes=True,
                              backref=db.backref("artists", lazy=True))
     time_available_from = db.Column(db.Time, nullable=False)
     time_available_to = db.Column(db.Time, nullable=False)
@@ -81,17 +262,47 @@ class Artist(db.Model):
     def __repr__(self):
         return f"<Artist {self.id} {self.name}>"
 
-    def upcoming_shows(self):
-        return db.session.query(Show).filter(Show.artist_id == self.id, Show.start_time > datetime.now()).all()
+    @classmethod
+    def page_version(cls, artist_id):
+        # see Venue.page_version
+        row = cls.page_version_query(artist_id).first()
+        return version_of(row) if row else None
+
+    @classmethod
+    def page_version_query(cls, artist_id):
+        now = datetime.now()
+        shows = all_shows("id", "start_time", "venue_id", "artist_id", "updated_at")
+        return db.session.query(cls.updated_at, db.func.max(shows.c.updated_at), db.func.max(Venue.updated_at),
+                                db.func.max(db.case((shows.c.start_time <= now, shows.c.start_time))),
+                                db.func.count(shows.c.id)) \
+            .outerjoin(shows, shows.c.artist_id == cls.id) \
+            .outerjoin(Venue, Venue.id == shows.c.venue_id) \
+            .filter(cls.id == artist_id) \
+            .group_by(cls.id, cls.updated_at)
+
+    def show_schedule(self, now=None):
+        # every show by this artist with its venue columns in one query,
+        # returned as (upcoming, past)
+        return split_shows(self.show_schedule_query(self.id).all(), now or datetime.now())
+
+    @classmethod
+    def show_schedule_query(cls, artist_id):
+        # see Venue.show_schedule_query
+        shows = all_shows("id", "start_time", "venue_id", "artist_id")
+        return db.session.query(shows.c.id, shows.c.start_time, shows.c.venue_id, Venue.name.label("venue_name"),
+                                Venue.image_link.label("venue_image_link")) \
+            .join(Venue, Venue.id == shows.c.venue_id) \
+            .filter(shows.c.artist_id == artist_id) \
+            .order_by(shows.c.start_time.asc(), shows.c.id.asc())
 
-    def past_shows(self):
-        return db.session.query(Show).filter(Show.artist_id == self.id, Show.start_time <= datetime.now()).all()
+    def is_available_at(self, time):
+        return is_available(self.time_available_from, self.time_available_to, time)
 
     def upcoming_shows_count(self):
-        return db.session.query(Show).filter(Show.artist_id == self.id, Show.start_time > datetime.now()).count()
+        return ShowCount.lookup(ShowCount.ARTIST, self.id)[0]
 
     def past_shows_count(self):
-        return db.session.query(Show).filter(Show.artist_id == self.id, Show.start_time <= datetime.now()).count()
+        return ShowCount.lookup(ShowCount.ARTIST, self.id)[1]
     # TODO: implement any missing fields, as a database migration using
     # Flask-Migrate
 
@@ -99,11 +310,169 @@ class Artist(db.Model):
 # TODO Implement Show and Artist models, and complete all model
 # relationships and properties, as a database migration.
 class Show(db.Model):
+    # on Postgres the migrations range-partition shows by month of
+    # start_time, with (id, start_time) as the table's primary key; old
+    # months move to shows_archive, see partitions.py
     __tablename__ = "shows"
+    __table_args__ = (
+        db.Index("ix_shows_venue_id_start_time", "venue_id", "start_time"),
+        db.Index("ix_shows_artist_id_start_time", "artist_id", "start_time"),
+        db.Index("ix_shows_start_time_id", "start_time", "id"),
+        db.Index("ix_shows_updated_at", "updated_at"),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    artist_id = db.Column(db.Integer, db.ForeignKey("artists.id"), nullable=False)
-    venue_id = db.Column(db.Integer, db.ForeignKey("venues.id"), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey("artists.id", ondelete="CASCADE"), nullable=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey("venues.id", ondelete="CASCADE"), nullable=False)
     start_time = db.Column(db.DateTime(), nullable=False)
+    end_time = db.Column(db.DateTime(), nullable=False, default=default_end_time)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, server_default=db.text("CURRENT_TIMESTAMP"))
 
     def __repr__(self):
-        return f"<Show {self.id}  starts {self.start_time}>"
\ No newline at end of file
+        return f"<Show {self.id}  starts {self.start_time}>"
+
+    @classmethod
+    def listing_query(cls, start=None, end=None, after=None, descending=False, versioned=False):
+        # keyset pages over (start_time, id) of both tiers, carrying only the
+        # venue/artist columns the show tiles need; `after` is the key of the
+        # last row seen, versioned adds the updated_at columns versioning the
+        # tiles. Postgres pushes the filters into each branch of the union
+        shows = all_shows("id", "start_time", "venue_id", "artist_id", "updated_at")
+        query = db.session.query(shows.c.id, shows.c.start_time, shows.c.venue_id, Venue.name.label("venue_name"),
+                                 shows.c.artist_id, Artist.name.label("artist_name"),
+                                 Artist.image_link.label("artist_image_link")) \
+            .join(Venue, Venue.id == shows.c.venue_id) \
+            .join(Artist, Artist.id == shows.c.artist_id)
+        if start is not None:
+            query = query.filter(shows.c.start_time >= start)
+        if end is not None:
+            query = query.filter(shows.c.start_time < end)
+        key = db.tuple_(shows.c.start_time, shows.c.id)
+        if after is not None:
+            query = query.filter(key < db.tuple_(*after) if descending else key > db.tuple_(*after))
+        if descending:
+            query = query.order_by(shows.c.start_time.desc(), shows.c.id.desc())
+        else:
+            query = query.order_by(shows.c.start_time.asc(), shows.c.id.asc())
+        if versioned:
+            query = query.add_columns(shows.c.updated_at, Venue.updated_at.label("venue_updated_at"),
+                                      Artist.updated_at.label("artist_updated_at"))
+        return query
+
+
+
+class ShowCount(db.Model):
+    """Materialized upcoming/past show counts per venue and artist.
+
+    Counts are split at RollupState.rolled_to rather than at the current
+    time; rollups.roll_forward() moves shows across as time passes.
+    """
+    __tablename__ = "show_counts"
+    VENUE = "venue"
+    ARTIST = "artist"
+    entity_type = db.Column(db.String(10), primary_key=True)
+    entity_id = db.Column(db.Integer, primary_key=True)
+    upcoming = db.Column(db.Integer, nullable=False, default=0)
+    past = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<ShowCount {self.entity_type} {self.entity_id}: {self.upcoming}/{self.past}>"
+
+    @classmethod
+    def lookup(cls, entity_type, entity_id):
+        # (upcoming, past) by primary key
+        row = db.session.query(cls.upcoming, cls.past) \
+            .filter(cls.entity_type == entity_type, cls.entity_id == entity_id) \
+            .first()
+        return tuple(row) if row else (0, 0)
+
+
+# past shows moved out of the hot table; same columns as shows
+show_archive = db.Table(
+    "shows_archive",
+    db.Column("id", db.Integer, primary_key=True, autoincrement=False),
+    db.Column("artist_id", db.Integer, db.ForeignKey("artists.id", ondelete="CASCADE"), nullable=False),
+    db.Column("venue_id", db.Integer, db.ForeignKey("venues.id", ondelete="CASCADE"), nullable=False),
+    db.Column("start_time", db.DateTime(), nullable=False),
+    db.Column("end_time", db.DateTime(), nullable=False),
+    db.Column("updated_at", db.DateTime, nullable=False),
+    db.Index("ix_shows_archive_venue_id_start_time", "venue_id", "start_time"),
+    db.Index("ix_shows_archive_artist_id_start_time", "artist_id", "start_time"),
+)
+
+
+def all_shows(*names):
+    # the hot and archived shows as one subquery of the named columns, for
+    # every read of shows that may reach into the past; the archive branch
+    # costs an index probe per archived month, nothing while it is empty
+    return db.union_all(db.select(*(Show.__table__.c[name] for name in names)),
+                        db.select(*(show_archive.c[name] for name in names))).subquery("all_shows")
+
+
+class RollupState(db.Model):
+    __tablename__ = "rollup_state"
+    id = db.Column(db.Integer, primary_key=True)
+    rolled_to = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<RollupState rolled to {self.rolled_to}>"
+
+
+# no two shows of one artist or one venue may overlap; Postgres only, the
+# in-process booking index covers the other databases
+event.listen(Show.__table__, "before_create",
+             DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect="postgresql"))
+for _column in ("artist_id", "venue_id"):
+    event.listen(Show.__table__, "after_create", DDL(
+        f"ALTER TABLE shows ADD CONSTRAINT shows_{_column}_no_overlap "
+        f"EXCLUDE USING gist ({_column} WITH =, tsrange(start_time, end_time) WITH &&)"
+    ).execute_if(dialect="postgresql"))
+
+
+def collection_version(*models):
+    # version of whole tables for the listing pages in one statement: the
+    # newest updated_at and row count of each, plus the newest show that
+    # has moved into the past when shows are involved, and the rollup point
+    # when the listing reads show_counts
+    return version_of(collection_version_query(*models).one())
+
+
+def collection_version_query(*models):
+    columns = []
+    for model in models:
+        if model is ShowCount:
+            # the counts move at roll-forward, not when a row is updated
+            columns.append(db.select(RollupState.rolled_to).where(RollupState.id == 1).scalar_subquery())
+            continue
+        columns.append(db.select(db.func.max(model.updated_at)).scalar_subquery())
+        columns.append(db.select(db.func.count(model.id)).scalar_subquery())
+    if Show in models:
+        columns.append(db.select(db.func.max(Show.start_time)).where(Show.start_time <= datetime.now()).scalar_subquery())
+    return db.session.query(*columns)
+
+
+@event.listens_for(Venue, "before_update")
+@event.listens_for(Artist, "before_update")
+@event.listens_for(Show, "before_update")
+def touch_updated_at(mapper, connection, target):
+    # also fires for relationship-only changes such as edited genres
+    target.updated_at = datetime.now()
+
+
+@event.listens_for(Venue, "before_insert")
+@event.listens_for(Venue, "before_update")
+@event.listens_for(Artist, "before_insert")
+@event.listens_for(Artist, "before_update")
+def sync_genre_ids(mapper, connection, target):
+    # mirrors the genre links into genre_ids whenever they were assigned
+    state = db.inspect(target)
+    if state.pending or state.attrs.genres.history.has_changes():
+        target.genre_ids = sorted(genre.id for genre in target.genres)
+
+
+@event.listens_for(Engine, "connect")
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite only enforces foreign keys, and so ON DELETE CASCADE, when asked
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
@@ -0,0 +1,172 @@
+"""Monthly partitions of the shows table and its archive tier (Postgres).
+
+    flask partitions ensure --months-ahead 12
+    flask partitions archive --older-than 12
+    flask partitions list
+
+The ``show partitions`` migration turns ``shows`` into a table range
+partitioned by month of ``start_time`` (``shows_p2026_10`` holds October
+2026) with a default partition for anything outside the created months, and
+adds ``shows_archive``, partitioned the same way. Queries on upcoming shows
+only touch the partitions of the months they ask for, and their indexes stay
+the size of a few months.
+
+``ensure`` creates the partitions of the coming months, moving any rows the
+default partition already holds for them. ``archive`` detaches the months
+older than ``--older-than`` from ``shows`` and attaches them to
+``shows_archive``; the show listings, the detail pages and the booking
+checks read both tiers (``models.all_shows``), so past shows stay visible.
+With ``--detach`` the partitions are left as standalone tables for dumping
+or dropping instead; run ``flask rollup check --repair`` after dropping them.
+
+The double-booking exclusion constraints are per partition, the default one
+included, so a booking crossing midnight at the end of a month is only
+checked by the in-process booking index.
+"""
+import re
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+
+from models import db
+
+PARTITION_NAME = re.compile(r"^shows_p(\d{4})_(\d{2})$")
+DEFAULT_PARTITION = "shows_pdefault"
+HOT, ARCHIVE = "shows", "shows_archive"
+
+
+def month_floor(value):
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"shows_p{month:%Y_%m}"
+
+
+def partitions(connection, parent):
+    # months of the monthly partitions attached to `parent`, oldest first
+    rows = connection.execute(db.text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = CAST(:parent AS regclass)"), {"parent": parent})
+    months = []
+    for (name,) in rows:
+        match = PARTITION_NAME.match(name)
+        if match:
+            months.append(datetime(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def bounds(month):
+    # FOR VALUES clause of a month; the values are generated, not user input
+    return f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+
+
+def create_partition(connection, month):
+    # built standalone and attached, so rows the default partition holds for
+    # the month can be moved over first
+    name = partition_name(month)
+    window = {"lower": month, "upper": add_months(month, 1)}
+    connection.execute(db.text(f"CREATE TABLE {name} (LIKE shows INCLUDING DEFAULTS)"))
+    connection.execute(db.text(f"INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} "
+                               "WHERE start_time >= :lower AND start_time < :upper"), window)
+    connection.execute(db.text(f"DELETE FROM {DEFAULT_PARTITION} "
+                               "WHERE start_time >= :lower AND start_time < :upper"), window)
+    for column in ("artist_id", "venue_id"):
+        connection.execute(db.text(
+            f"ALTER TABLE {name} ADD CONSTRAINT {name}_{column}_no_overlap "
+            f"EXCLUDE USING gist ({column} WITH =, tsrange(start_time, end_time) WITH &&)"))
+    connection.execute(db.text(f"ALTER TABLE {HOT} ATTACH PARTITION {name} {bounds(month)}"))
+    return name
+
+
+def ensure(months_ahead=12, now=None):
+    # creates the missing partitions from this month on; returns their names
+    current = month_floor(now or datetime.now())
+    created = []
+    connection = db.session.connection()
+    existing = set(partitions(connection, HOT)) | set(partitions(connection, ARCHIVE))
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if month not in existing:
+            created.append(create_partition(connection, month))
+            db.session.commit()
+            connection = db.session.connection()
+    db.session.commit()
+    return created
+
+
+def archive(older_than=12, detach_only=False, now=None):
+    # moves the months ending before the cutoff out of the hot table;
+    # returns the names moved
+    if older_than < 1:
+        raise ValueError("only months that have ended can be archived")
+    cutoff = add_months(month_floor(now or datetime.now()), -older_than)
+    moved = []
+    for month in partitions(db.session.connection(), HOT):
+        if month >= cutoff:
+            break
+        name = partition_name(month)
+        connection = db.session.connection()
+        connection.execute(db.text(f"ALTER TABLE {HOT} DETACH PARTITION {name}"))
+        if not detach_only:
+            connection.execute(db.text(f"ALTER TABLE {ARCHIVE} ATTACH PARTITION {name} {bounds(month)}"))
+        db.session.commit()
+        moved.append(name)
+    db.session.commit()
+    return moved
+
+
+def require_postgres():
+    if db.engine.dialect.name != "postgresql":
+        raise click.ClickException("show partitions need Postgres")
+
+
+@click.group("partitions")
+def partitions_command():
+    """Maintain the monthly partitions of the shows table."""
+
+
+@partitions_command.command("ensure")
+@click.option("--months-ahead", default=12, show_default=True, help="Months after this one to create.")
+@with_appcontext
+def ensure_command(months_ahead):
+    """Create the partitions of the coming months."""
+    require_postgres()
+    created = ensure(months_ahead)
+    for name in created:
+        click.echo(f"created {name}")
+    click.echo(f"{len(created)} partitions created.")
+
+
+@partitions_command.command("archive")
+@click.option("--older-than", default=12, show_default=True, help="Months to keep in the hot table.")
+@click.option("--detach", "detach_only", is_flag=True,
+              help="Leave the old partitions as standalone tables instead of archiving them.")
+@with_appcontext
+def archive_command(older_than, detach_only):
+    """Move old months out of the hot shows table."""
+    require_postgres()
+    if older_than < 1:
+        raise click.BadParameter("must be at least 1", param_hint="--older-than")
+    moved = archive(older_than, detach_only)
+    for name in moved:
+        click.echo(f"{'detached' if detach_only else 'archived'} {name}")
+    click.echo(f"{len(moved)} partitions {'detached' if detach_only else 'archived'}.")
+
+
+@partitions_command.command("list")
+@with_appcontext
+def list_command():
+    """Show the monthly partitions of each tier."""
+    require_postgres()
+    connection = db.session.connection()
+    for parent in (HOT, ARCHIVE):
+        months = partitions(connection, parent)
+        click.echo(f"{parent}: " + (", ".join(partition_name(month) for month in months) or "none"))
@@ -0,0 +1,133 @@
+"""Bulk retirement of venues and artists.
+
+    flask retire venues --ids 4,8,15
+    flask retire artists retired.txt --archive retired.jsonl --batch-size 500
+
+Ids come from ``--ids`` or a file with one id per line. They are deleted in
+chunks of ``--batch-size``, each chunk in its own transaction: the show
+counters are adjusted, the rows are optionally appended to an ``--archive``
+file as JSON lines (one per entity, with its genres and shows), and a single
+``DELETE ... WHERE id IN (...)`` removes the entities. Their shows and genre
+links go with them through the ``ON DELETE CASCADE`` foreign keys, so no row
+is loaded into the session and locks are held for one chunk at a time.
+
+Running workers hear of the retirement through the view cache backend: the
+retired pages are deleted from it, and the feed, name and booking indexes
+follow generation tokens stored in it. That needs ``CACHE_BACKEND = "redis"``;
+with the memory backend every process has its own cache, so workers keep
+serving the retired entities from memory until they restart, and the command
+says so.
+"""
+import json
+from datetime import date, datetime, time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from booking import booking_index
+from cache import venue_key, artist_key, shared_between_processes
+from models import db, Venue, Artist, Show, Genre, ShowCount, venue_genre, artist_genre, all_shows
+from rollups import forget
+
+KINDS = {
+    "venues": (Venue, Show.venue_id, Show.artist_id, venue_genre, venue_genre.c.venue_id, ShowCount.VENUE),
+    "artists": (Artist, Show.artist_id, Show.venue_id, artist_genre, artist_genre.c.artist_id, ShowCount.ARTIST),
+}
+
+
+def archive_default(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def archive_records(kind, ids):
+    # one dict per existing entity: its columns, genre names and shows
+    model, own, _, links, link_column, _ = KINDS[kind]
+    records = {row.id: dict(row._asdict(), genres=[], shows=[])
+               for row in db.session.query(*model.__table__.columns).filter(model.id.in_(ids))}
+    for entity_id, name in db.session.query(link_column, Genre.name) \
+            .join(Genre, Genre.id == links.c.genre_id).filter(link_column.in_(ids)):
+        records[entity_id]["genres"].append(name)
+    shows = all_shows(*(column.name for column in Show.__table__.columns))
+    for row in db.session.query(shows).filter(shows.c[own.key].in_(ids)).order_by(shows.c.start_time):
+        records[getattr(row, own.key)]["shows"].append(row._asdict())
+    return list(records.values())
+
+
+def stale_keys(kind, ids):
+    # the retired pages plus the pages listing them on their shows
+    _, own, other, _, _, _ = KINDS[kind]
+    own_key, other_key = (venue_key, artist_key) if kind == "venues" else (artist_key, venue_key)
+    shows = all_shows(own.key, other.key)
+    others = db.session.query(shows.c[other.key]).filter(shows.c[own.key].in_(ids)).distinct()
+    return [own_key(entity_id) for entity_id in ids] + [other_key(row[0]) for row in others]
+
+
+def retire(kind, ids, batch_size=500, archive=None):
+    # returns the number of entities deleted; `archive` is a text stream
+    model, _, _, _, _, entity_type = KINDS[kind]
+    retired = 0
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start:start + batch_size]
+        try:
+            keys = stale_keys(kind, chunk)
+            records = archive_records(kind, chunk) if archive is not None else []
+            forget(entity_type, chunk)
+            deleted = db.session.execute(model.__table__.delete().where(model.id.in_(chunk))).rowcount
+            # archived before the commit, so no deleted row is missing from it
+            for record in records:
+                archive.write(json.dumps(record, default=archive_default) + "\n")
+            if archive is not None:
+                archive.flush()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        current_app.extensions["view_cache"].delete(*keys)
+        retired += deleted
+    if retired:
+        # running workers reload their recently listed feed, name and
+        # booking indexes
+        current_app.extensions["recent_listings"].touch()
+        current_app.extensions["name_search"].touch()
+        booking_index.touch()
+    return retired
+
+
+def read_ids(path, ids):
+    values = []
+    if ids:
+        values.extend(ids.split(","))
+    if path:
+        with open(path, encoding="utf-8") as stream:
+            values.extend(stream)
+    try:
+        return sorted({int(value) for value in values if value.strip()})
+    except ValueError as error:
+        raise click.BadParameter(f"not an id: {error}")
+
+
+@click.command("retire")
+@click.argument("kind", type=click.Choice(sorted(KINDS)))
+@click.argument("path", required=False, type=click.Path(exists=True, dir_okay=False))
+@click.option("--ids", help="Comma separated ids, in addition to those in PATH.")
+@click.option("--batch-size", default=500, show_default=True, help="Entities per transaction.")
+@click.option("--archive", "archive_path", type=click.Path(dir_okay=False),
+              help="Append the deleted entities with their genres and shows to this JSONL file.")
+@with_appcontext
+def retire_command(kind, path, ids, batch_size, archive_path):
+    """Delete many venues or artists, with their shows, in chunks."""
+    entity_ids = read_ids(path, ids)
+    if not entity_ids:
+        raise click.UsageError("give the ids with --ids or in a file")
+    if archive_path:
+        with open(archive_path, "a", encoding="utf-8") as archive:
+            retired = retire(kind, entity_ids, batch_size, archive)
+    else:
+        retired = retire(kind, entity_ids, batch_size)
+    click.echo(f"Retired {retired} {kind}.")
+    if retired and not shared_between_processes(current_app):
+        click.echo("CACHE_BACKEND is not redis: running workers keep their cached pages and indexes "
+                   "until they restart.", err=True)
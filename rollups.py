@@ -0,0 +1,172 @@
+"""Maintenance of the show_counts rollup.
+
+Every venue and artist has one ``show_counts`` row holding how many of its
+shows start after (upcoming) or at/before (past) ``rollup_state.rolled_to``.
+Writers adjust the counters in the same transaction as the shows they add or
+remove; ``flask rollup roll-forward``, run from cron every minute or so,
+moves the shows that started since the last run from upcoming to past and
+advances ``rolled_to``. ``flask rollup check`` recounts from the shows table
+and reports (or with ``--repair`` fixes) any counter that drifted.
+"""
+from collections import defaultdict
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Show, ShowCount, RollupState, all_shows
+
+
+def lock_state(exclusive=False):
+    # the state row is locked for share by writers and exclusively by
+    # roll_forward, so a show added concurrently is never skipped by a roll
+    state = RollupState.query.with_for_update(read=not exclusive).get(1)
+    if state is None:
+        state = RollupState(id=1, rolled_to=datetime.now())
+        db.session.add(state)
+        db.session.flush()
+    return state
+
+
+def apply_deltas(deltas):
+    # deltas: {(entity_type, entity_id): [upcoming, past]} added atomically
+    rows = [
+        {"entity_type": entity_type, "entity_id": entity_id, "upcoming": upcoming, "past": past}
+        for (entity_type, entity_id), (upcoming, past) in deltas.items() if upcoming or past
+    ]
+    if not rows:
+        return
+    connection = db.session.connection()
+    table = ShowCount.__table__
+    if connection.dialect.name in ("postgresql", "sqlite"):
+        dialect = postgresql if connection.dialect.name == "postgresql" else sqlite
+        statement = dialect.insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=["entity_type", "entity_id"],
+            set_={"upcoming": table.c.upcoming + statement.excluded.upcoming,
+                  "past": table.c.past + statement.excluded.past})
+        connection.execute(statement, rows)
+        return
+    for row in rows:
+        updated = connection.execute(
+            table.update()
+            .where(table.c.entity_type == row["entity_type"], table.c.entity_id == row["entity_id"])
+            .values(upcoming=table.c.upcoming + row["upcoming"], past=table.c.past + row["past"]))
+        if not updated.rowcount:
+            connection.execute(table.insert(), row)
+
+
+def record_shows(shows, sign=1):
+    # shows: iterable of (venue_id, artist_id, start_time) being added
+    # (sign=1) or removed (sign=-1) in the current transaction
+    rolled_to = lock_state().rolled_to
+    deltas = defaultdict(lambda: [0, 0])
+    for venue_id, artist_id, start_time in shows:
+        bucket = 0 if start_time > rolled_to else 1
+        deltas[ShowCount.VENUE, venue_id][bucket] += sign
+        deltas[ShowCount.ARTIST, artist_id][bucket] += sign
+    apply_deltas(deltas)
+
+
+def forget_venue(venue_id):
+    # called before a venue and its shows are deleted
+    forget(ShowCount.VENUE, [venue_id])
+
+
+def forget(entity_type, entity_ids):
+    # called before venues or artists and their shows are deleted: drops
+    # their counters and takes their shows off the other side's counters
+    # archived shows are counted as past, so both tiers are read
+    shows = all_shows("id", "venue_id", "artist_id", "start_time")
+    if entity_type == ShowCount.VENUE:
+        own, other, other_type = shows.c.venue_id, shows.c.artist_id, ShowCount.ARTIST
+    else:
+        own, other, other_type = shows.c.artist_id, shows.c.venue_id, ShowCount.VENUE
+    rolled_to = lock_state().rolled_to
+    rows = db.session.query(other,
+                            db.func.count(db.case((shows.c.start_time > rolled_to, shows.c.id))),
+                            db.func.count(db.case((shows.c.start_time <= rolled_to, shows.c.id)))) \
+        .filter(own.in_(entity_ids)) \
+        .group_by(other)
+    apply_deltas({(other_type, entity_id): [-upcoming, -past] for entity_id, upcoming, past in rows})
+    ShowCount.query.filter(ShowCount.entity_type == entity_type, ShowCount.entity_id.in_(entity_ids)) \
+        .delete(synchronize_session=False)
+
+
+def roll_forward(now=None):
+    # moves shows that started in (rolled_to, now] from upcoming to past;
+    # returns the number of shows moved
+    now = now or datetime.now()
+    state = lock_state(exclusive=True)
+    if now <= state.rolled_to:
+        db.session.commit()
+        return 0
+    window = db.and_(Show.start_time > state.rolled_to, Show.start_time <= now)
+    deltas = {}
+    moved = 0
+    for column, entity_type in ((Show.venue_id, ShowCount.VENUE), (Show.artist_id, ShowCount.ARTIST)):
+        for entity_id, count in db.session.query(column, db.func.count(Show.id)).filter(window).group_by(column):
+            deltas[entity_type, entity_id] = [-count, count]
+            if entity_type == ShowCount.VENUE:
+                moved += count
+    apply_deltas(deltas)
+    state.rolled_to = now
+    db.session.commit()
+    return moved
+
+
+def recount():
+    # {(entity_type, entity_id): (upcoming, past)} straight from the hot
+    # and archived shows
+    rolled_to = lock_state(exclusive=True).rolled_to
+    shows = all_shows("id", "venue_id", "artist_id", "start_time")
+    counts = {}
+    for column, entity_type in ((shows.c.venue_id, ShowCount.VENUE), (shows.c.artist_id, ShowCount.ARTIST)):
+        rows = db.session.query(column,
+                                db.func.count(db.case((shows.c.start_time > rolled_to, shows.c.id))),
+                                db.func.count(db.case((shows.c.start_time <= rolled_to, shows.c.id)))) \
+            .group_by(column)
+        for entity_id, upcoming, past in rows:
+            counts[entity_type, entity_id] = (upcoming, past)
+    return counts
+
+
+def check(repair=False):
+    # returns [(entity_type, entity_id, stored, actual)] for drifted counters
+    actual = recount()
+    stored = {(row.entity_type, row.entity_id): (row.upcoming, row.past) for row in ShowCount.query}
+    drift = []
+    for key in sorted(actual.keys() | stored.keys()):
+        expected = actual.get(key, (0, 0))
+        found = stored.get(key, (0, 0))
+        if expected != found:
+            drift.append((key[0], key[1], found, expected))
+    if repair and drift:
+        apply_deltas({(entity_type, entity_id): [expected[0] - found[0], expected[1] - found[1]]
+                      for entity_type, entity_id, found, expected in drift})
+    db.session.commit()
+    return drift
+
+
+@click.group("rollup")
+def rollup_command():
+    """Maintain the show_counts rollup."""
+
+
+@rollup_command.command("roll-forward")
+@with_appcontext
+def roll_forward_command():
+    """Move shows that have started from upcoming to past."""
+    click.echo(f"Moved {roll_forward()} shows to past.")
+
+
+@rollup_command.command("check")
+@click.option("--repair", is_flag=True, help="Overwrite drifted counters with the recounted values.")
+@with_appcontext
+def check_command(repair):
+    """Recount shows and report counters that drifted."""
+    drift = check(repair=repair)
+    for entity_type, entity_id, found, expected in drift:
+        click.echo(f"{entity_type} {entity_id}: stored {found}, actual {expected}")
+    click.echo(f"{len(drift)} drifted counters{' repaired' if repair and drift else ''}.")
@@ -0,0 +1,105 @@
+"""Read replica routing for the SQLAlchemy session.
+
+Replicas are configured as ``SQLALCHEMY_BINDS`` whose key starts with
+``replica`` (config.py builds them from ``DATABASE_REPLICA_URLS``). Views
+marked with ``@read_only`` run their queries on one replica picked per
+request; everything else, and any flush, goes to the primary.
+
+A request that writes makes the client sticky: for
+``DB_REPLICA_STICKY_SECONDS`` its read-only requests also go to the
+primary, so a user sees their own change even while the replicas lag.
+Caches shared by every client therefore load under ``primary()``, and the
+view cache is bypassed while a client is sticky.
+"""
+import random
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+
+STICKY_SESSION_KEY = "_primary_until"
+_UNSET = object()
+
+
+def read_only(view):
+    """Mark a view whose queries may be served by a replica."""
+    view.read_only = True
+    return view
+
+
+def replica_keys(app):
+    return sorted(key for key in (app.config.get("SQLALCHEMY_BINDS") or {}) if key.startswith("replica"))
+
+
+def is_sticky():
+    # whether the current client wrote recently and must read the primary
+    return session.get(STICKY_SESSION_KEY, 0) > time.time()
+
+
+@contextmanager
+def primary():
+    """Run the enclosed queries on the primary even in a read-only view."""
+    if not has_request_context():
+        yield
+        return
+    replica = g.pop("db_replica", _UNSET)
+    g.db_replica = None
+    try:
+        yield
+    finally:
+        if replica is _UNSET:
+            g.pop("db_replica", None)
+        else:
+            g.db_replica = replica
+
+
+class RoutingSession(SignallingSession):
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing:
+            if has_request_context():
+                g.db_wrote = True
+        elif not (mapper is not None and mapper.persist_selectable.info.get("bind_key")):
+            replica = self._replica()
+            if replica is not None:
+                return self.db.get_engine(self.app, bind=replica)
+        return super().get_bind(mapper, clause)
+
+    def commit(self):
+        super().commit()
+        if has_request_context():
+            g.db_wrote = True
+
+    def _replica(self):
+        # the replica bind key for this request, None for the primary
+        if not has_request_context() or g.get("db_wrote"):
+            return None
+        if "db_replica" not in g:
+            view = current_app.view_functions.get(request.endpoint)
+            keys = replica_keys(current_app)
+            g.db_replica = random.choice(keys) if keys and getattr(view, "read_only", False) and not is_sticky() \
+                else None
+        return g.db_replica
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy whose sessions route read-only views to replicas."""
+
+    def init_app(self, app):
+        app.config.setdefault("DB_REPLICA_STICKY_SECONDS", 10)
+        super().init_app(app)
+        app.after_request(self._stick_after_write)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def _stick_after_write(self, response):
+        if g.get("db_wrote") and replica_keys(current_app):
+            session[STICKY_SESSION_KEY] = time.time() + current_app.config["DB_REPLICA_STICKY_SECONDS"]
+        return response
+
@@ -0,0 +1,431 @@
+"""Name search for venues and artists.
+
+Two backends answer the case-insensitive substring search behind
+``/venues/search`` and ``/artists/search``:
+
+* ``TrigramSearch`` runs on Postgres and relies on the pg_trgm GIN indexes
+  created by the ``name trigram indexes`` migration. Matches are ranked by
+  trigram similarity and the total comes back on every row through a window
+  count, so one statement answers both the page and the count.
+* ``NgramSearch`` keeps an in-process inverted index of the 1-, 2- and
+  3-grams of every name. It works on any database (SQLite, tests) and only
+  looks at the names sharing the rarest n-gram of the search term.
+
+``SEARCH_BACKEND`` selects ``"trigram"``, ``"ngram"`` or ``"auto"`` (the
+default), which picks the trigram backend on Postgres.
+
+``/autocomplete`` is answered by a ``PrefixIndex`` per model whatever the
+backend: sorted arrays of lowered names and of the words inside them, where
+the completions of a prefix are a contiguous run found by binary search.
+They are built before the first request. Afterwards the write handlers'
+``index``/``discard`` calls insert and remove single entries in the sorted
+arrays, and other processes' writes are picked up by the same background
+rebuild as the n-gram index, so no autocomplete waits for a reload.
+
+The write handlers apply each change to their worker's indexes in place.
+Other workers only learn of it through a generation token in the view cache
+backend, which every write replaces and which never expires: a worker whose
+token differs rebuilds its indexes on a background thread and swaps them in,
+answering from the old ones meanwhile. Bulk writers (``flask import``,
+``flask retire``) call ``NameSearch.touch``. The token is only shared between
+processes with the Redis backend; with the memory backend each process sees
+its own writes alone.
+"""
+import threading
+import uuid
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from flask import current_app
+
+from cache import _MISSING
+from models import db, Venue, Artist
+from routing import primary
+
+NGRAM_SIZE = 3
+GENERATION_KEY = "search:generation"
+
+
+def ngrams(text, size):
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class NgramIndex:
+    """Inverted index from name n-grams to entity ids for one model."""
+
+    def __init__(self, size=NGRAM_SIZE):
+        self.size = size
+        self.names = {}
+        self.postings = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def _grams(self, name):
+        grams = set()
+        for size in range(1, self.size + 1):
+            grams |= ngrams(name, size)
+        return grams
+
+    def add(self, entity_id, name):
+        with self.lock:
+            self._discard(entity_id)
+            lowered = name.lower()
+            self.names[entity_id] = (lowered, name)
+            for gram in self._grams(lowered):
+                self.postings[gram].add(entity_id)
+
+    def discard(self, entity_id):
+        with self.lock:
+            self._discard(entity_id)
+
+    def _discard(self, entity_id):
+        entry = self.names.pop(entity_id, None)
+        if entry is None:
+            return
+        for gram in self._grams(entry[0]):
+            ids = self.postings[gram]
+            ids.discard(entity_id)
+            if not ids:
+                del self.postings[gram]
+
+    def _candidates(self, term):
+        if not term:
+            return set(self.names)
+        if len(term) <= self.size:
+            # the term is itself an indexed gram, so its posting list is exact
+            return set(self.postings.get(term, ()))
+        lists = sorted((self.postings.get(gram, set()) for gram in ngrams(term, self.size)), key=len)
+        candidates = set(lists[0])
+        for ids in lists[1:]:
+            candidates &= ids
+            if not candidates:
+                break
+        return candidates
+
+    def search(self, term):
+        # returns [(id, name)] best match first: earliest match position,
+        # then shortest name
+        term = term.lower()
+        with self.lock:
+            matches = []
+            for entity_id in self._candidates(term):
+                lowered, name = self.names[entity_id]
+                position = lowered.find(term)
+                if position >= 0:
+                    matches.append((position, len(name), entity_id, name))
+        matches.sort()
+        return [(entity_id, name) for _, _, entity_id, name in matches]
+
+
+class PrefixIndex:
+    """Sorted (lowered name, id) and (lowered word onwards, id) arrays."""
+
+    def __init__(self):
+        self.names = {}
+        self.full = []
+        self.words = []
+        self.lock = threading.Lock()
+
+    def _keys(self, name):
+        lowered = name.lower()
+        starts = [i for i in range(1, len(lowered)) if lowered[i - 1] == " " and lowered[i] != " "]
+        return lowered, [lowered[i:] for i in starts]
+
+    def load(self, rows):
+        with self.lock:
+            self.names, self.full, self.words = {}, [], []
+            for entity_id, name in rows:
+                self.names[entity_id] = name
+                lowered, words = self._keys(name)
+                self.full.append((lowered, entity_id))
+                self.words.extend((word, entity_id) for word in words)
+            self.full.sort()
+            self.words.sort()
+
+    def add(self, entity_id, name):
+        with self.lock:
+            self._discard(entity_id)
+            self.names[entity_id] = name
+            lowered, words = self._keys(name)
+            insort(self.full, (lowered, entity_id))
+            for word in words:
+                insort(self.words, (word, entity_id))
+
+    def discard(self, entity_id):
+        with self.lock:
+            self._discard(entity_id)
+
+    def _discard(self, entity_id):
+        name = self.names.pop(entity_id, None)
+        if name is None:
+            return
+        lowered, words = self._keys(name)
+        for array, key in [(self.full, lowered)] + [(self.words, word) for word in words]:
+            position = bisect_left(array, (key, entity_id))
+            if position < len(array) and array[position] == (key, entity_id):
+                del array[position]
+
+    def complete(self, prefix, limit=10):
+        # [(id, name)]: names starting with the prefix in name order, then
+        # names with a later word starting with it
+        prefix = prefix.lower().strip()
+        if not prefix:
+            return []
+        matches = []
+        seen = set()
+        with self.lock:
+            for array in (self.full, self.words):
+                position = bisect_left(array, (prefix,))
+                while position < len(array) and len(matches) < limit:
+                    key, entity_id = array[position]
+                    if not key.startswith(prefix):
+                        break
+                    if entity_id not in seen:
+                        seen.add(entity_id)
+                        matches.append((entity_id, self.names[entity_id]))
+                    position += 1
+        return matches
+
+
+class NgramSearch:
+    def __init__(self):
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+    def _index_for(self, model):
+        index = self.indexes.get(model)
+        if index is None:
+            with self.lock:
+                index = self.indexes.get(model)
+                if index is None:
+                    index = self.indexes[model] = self.build(model)
+        return index
+
+    def build(self, model):
+        index = NgramIndex()
+        # shared by every client, so never built from a replica
+        with primary():
+            for entity_id, name in db.session.query(model.id, model.name):
+                index.add(entity_id, name)
+        return index
+
+    def search(self, model, term):
+        matches = self._index_for(model).search(term)
+        return matches, len(matches)
+
+    def apply(self, model, entity_id, name):
+        apply_change(self.indexes, model, entity_id, name)
+
+    def rebuilt(self):
+        # fresh copies of the indexes built so far, for replace()
+        return {model: self.build(model) for model in list(self.indexes)}
+
+    def replace(self, indexes):
+        with self.lock:
+            self.indexes = indexes
+
+    def clear(self):
+        # the indexes are rebuilt from the database on the next search
+        with self.lock:
+            self.indexes = {}
+
+
+class TrigramSearch:
+    def search(self, model, term):
+        return self.matches(self.query(model, term).all())
+
+    def query(self, model, term):
+        pattern = "%{}%".format(term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_"))
+        return db.session.query(model.id, model.name, db.func.count().over().label("total")) \
+            .filter(model.name.ilike(pattern, escape="\\")) \
+            .order_by(db.func.similarity(model.name, term).desc(), model.name.asc())
+
+    def matches(self, rows):
+        count = rows[0].total if rows else 0
+        return [(row.id, row.name) for row in rows], count
+
+    def apply(self, model, entity_id, name):
+        # the GIN index is maintained by Postgres
+        pass
+
+    def rebuilt(self):
+        return None
+
+    def replace(self, indexes):
+        pass
+
+    def clear(self):
+        pass
+
+
+def apply_change(indexes, model, entity_id, name):
+    # adds or renames an entity in {model: index}, or drops it when name is
+    # None; models without an index yet load it whole when first used
+    index = indexes.get(model)
+    if index is not None:
+        if name is None:
+            index.discard(entity_id)
+        else:
+            index.add(entity_id, name)
+
+
+class NameSearch:
+    """Flask extension exposing the configured search backend."""
+
+    models = (Venue, Artist)
+
+    def __init__(self, app=None):
+        self._backends = {}
+        self._prefixes = {}
+        self._generations = {}
+        self._rebuilds = {}
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("SEARCH_BACKEND", "auto")
+        app.config.setdefault("AUTOCOMPLETE_LIMIT", 10)
+        app.extensions["name_search"] = self
+        app.before_first_request(self.prefixes)
+
+    def prefixes(self):
+        # {model: PrefixIndex} for the current app, loaded on first use
+        app = current_app._get_current_object()
+        self._refresh(app)
+        prefixes = self._prefixes.get(app)
+        if prefixes is None:
+            with self.lock:
+                prefixes = self._prefixes.get(app)
+                if prefixes is None:
+                    prefixes = self._prefixes[app] = self._load_prefixes()
+        return prefixes
+
+    def _load_prefixes(self):
+        prefixes = {}
+        with primary():
+            for model in self.models:
+                prefixes[model] = PrefixIndex()
+                prefixes[model].load(db.session.query(model.id, model.name))
+        return prefixes
+
+    @property
+    def backend(self):
+        app = current_app._get_current_object()
+        backend = self._backends.get(app)
+        if backend is None:
+            name = app.config["SEARCH_BACKEND"]
+            if name == "auto":
+                name = "trigram" if db.engine.dialect.name == "postgresql" else "ngram"
+            backend = TrigramSearch() if name == "trigram" else NgramSearch()
+            self._backends[app] = backend
+        if isinstance(backend, NgramSearch):
+            self._refresh(app)
+        return backend
+
+    def _refresh(self, app):
+        # starts a background rebuild when another process wrote since this
+        # worker's indexes were built; they keep answering meanwhile
+        cache = app.extensions["view_cache"]
+        generation = cache.backend.get(GENERATION_KEY)
+        if generation is not _MISSING and generation == self._generations.get(app):
+            return
+        with self.lock:
+            self._check(app, cache, generation)
+
+    def _check(self, app, cache, generation):
+        # under self.lock: adopts the token `generation`, rebuilding if the
+        # indexes may be behind it
+        if generation is not _MISSING and generation == self._generations.get(app):
+            return
+        built = app in self._prefixes or getattr(self._backends.get(app), "indexes", None)
+        if generation is _MISSING:
+            # lost, e.g. a restarted Redis, so writes may have gone unseen
+            generation = self._touch(cache)
+        self._generations[app] = generation
+        if built:
+            self._start_rebuild(app)
+
+    def _start_rebuild(self, app):
+        # under self.lock; changes applied meanwhile are replayed on the new
+        # indexes before they replace the current ones
+        rebuild = self._rebuilds.get(app)
+        if rebuild is not None:
+            rebuild["again"] = True
+            return
+        rebuild = self._rebuilds[app] = {"again": False, "changes": []}
+        rebuild["thread"] = threading.Thread(target=self._rebuild, args=(app,), daemon=True)
+        rebuild["thread"].start()
+
+    def _rebuild(self, app):
+        with app.app_context():
+            try:
+                while True:
+                    backend = self._backends.get(app)
+                    indexes = backend.rebuilt() if backend is not None else None
+                    prefixes = self._load_prefixes() if app in self._prefixes else None
+                    with self.lock:
+                        rebuild = self._rebuilds[app]
+                        for change in rebuild["changes"]:
+                            if indexes is not None:
+                                apply_change(indexes, *change)
+                            if prefixes is not None:
+                                apply_change(prefixes, *change)
+                        if indexes is not None:
+                            backend.replace(indexes)
+                        if prefixes is not None:
+                            self._prefixes[app] = prefixes
+                        if not rebuild["again"]:
+                            del self._rebuilds[app]
+                            return
+                        rebuild.update(again=False, changes=[])
+            except Exception:
+                app.logger.exception("rebuilding the search indexes failed")
+                with self.lock:
+                    # the next lookup tries again
+                    self._rebuilds.pop(app, None)
+                    self._generations.pop(app, None)
+
+    def _touch(self, cache):
+        generation = uuid.uuid4().hex
+        # no expiry: a token that lapsed would read as a write
+        cache.backend.set(GENERATION_KEY, generation, expire=False)
+        return generation
+
+    def touch(self):
+        # for writes that bypass the handlers, e.g. bulk imports
+        self._touch(current_app.extensions["view_cache"])
+
+    def search(self, model, term):
+        return self.response(*self.backend.search(model, term))
+
+    def response(self, matches, count):
+        return {
+            "count": count,
+            "data": [{"id": entity_id, "name": name} for entity_id, name in matches]
+        }
+
+    def autocomplete(self, model, prefix, limit=None):
+        limit = limit or current_app.config["AUTOCOMPLETE_LIMIT"]
+        return [{"id": entity_id, "name": name} for entity_id, name in self.prefixes()[model].complete(prefix, limit)]
+
+    def index(self, entity):
+        self._write(type(entity), entity.id, entity.name)
+
+    def discard(self, model, entity_id):
+        self._write(model, entity_id, None)
+
+    def _write(self, model, entity_id, name):
+        # applies one change to this worker's indexes and tells the others,
+        # which rebuild theirs
+        app = current_app._get_current_object()
+        backend = self.backend
+        cache = app.extensions["view_cache"]
+        with self.lock:
+            # behind another process's writes as well
+            self._check(app, cache, cache.backend.get(GENERATION_KEY))
+            backend.apply(model, entity_id, name)
+            apply_change(self._prefixes.get(app, {}), model, entity_id, name)
+            rebuild = self._rebuilds.get(app)
+            if rebuild is not None:
+                rebuild["changes"].append((model, entity_id, name))
+            self._generations[app] = self._touch(cache)
@@ -0,0 +1,74 @@
+import os
+import sys
+from datetime import datetime, time, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# config.py reads this at import; each test then points the app at its own file
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app import app as flask_app  # noqa: E402
+from booking import booking_index  # noqa: E402
+from models import db, Venue, Artist, Show, RollupState, genre_resolver  # noqa: E402
+from rollups import record_shows  # noqa: E402
+
+
+def reset_state(app):
+    # the in-process caches and indexes outlive a test's database
+    app.extensions["view_cache"]._backends.clear()
+    app.jinja_env.fragment_cache.clear()
+    for rebuild in list(app.extensions["name_search"]._rebuilds.values()):
+        rebuild["thread"].join()
+    app.extensions["name_search"]._backends.clear()
+    app.extensions["name_search"]._prefixes.clear()
+    app.extensions["name_search"]._generations.clear()
+    app.extensions["recent_listings"]._buffers.clear()
+    app.extensions["recent_listings"]._generations.clear()
+    genre_resolver.clear()
+    booking_index.clear()
+
+
+@pytest.fixture
+def app(tmp_path):
+    flask_app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'test.db'}", SQLALCHEMY_BINDS={},
+                            WTF_CSRF_ENABLED=False, TESTING=True)
+    reset_state(flask_app)
+    with flask_app.app_context():
+        db.create_all()
+        db.session.add(RollupState(id=1, rolled_to=datetime.now()))
+        db.session.commit()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+    reset_state(flask_app)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def add_venue(name="The Musical Hop", city="San Francisco", state="CA"):
+    venue = Venue(name=name, city=city, state=state, address="1015 Folsom Street", phone="123-123-1234")
+    db.session.add(venue)
+    db.session.commit()
+    return venue
+
+
+def add_artist(name="Guns N Petals", city="San Francisco", state="CA"):
+    artist = Artist(name=name, city=city, state=state, phone="326-123-5000",
+                    time_available_from=time(0, 0), time_available_to=time(23, 59))
+    db.session.add(artist)
+    db.session.commit()
+    return artist
+
+
+def add_show(venue, artist, start_time, minutes=60):
+    # written the way the handlers do, counters included
+    show = Show(venue_id=venue.id, artist_id=artist.id, start_time=start_time,
+                end_time=start_time + timedelta(minutes=minutes))
+    db.session.add(show)
+    record_shows([(venue.id, artist.id, start_time)])
+    db.session.commit()
+    return show
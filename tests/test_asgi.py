@@ -0,0 +1,49 @@
+import asyncio
+import json
+
+from conftest import add_venue
+
+
+def call(path):
+    # the messages asgi.application sends for a GET of `path`
+    from asgi import application, database
+
+    sent = []
+    scope = {"type": "http", "method": "GET", "path": path, "headers": [], "query_string": b"",
+             "http_version": "1.1"}
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    async def run():
+        try:
+            await application(scope, receive, send)
+        finally:
+            await database.dispose()
+
+    asyncio.run(run())
+    return sent
+
+
+def test_wsgi_fallback_streams_the_body(app):
+    for number in range(3):
+        add_venue(name=f"Venue {number}")
+    start, *bodies = call("/api/v1/venues")
+    assert start["status"] == 200
+    # one message per row, then the end of the body
+    assert [body["more_body"] for body in bodies[:-1]] == [True] * 3
+    assert bodies[-1] == {"type": "http.response.body", "body": b""}
+    rows = [json.loads(line) for line in b"".join(body["body"] for body in bodies).splitlines()]
+    assert sorted(row["name"] for row in rows) == ["Venue 0", "Venue 1", "Venue 2"]
+
+
+def test_async_views_run_before_first_request_hooks(app):
+    add_venue()
+    app._got_first_request = False
+    start, body = call("/venues")
+    assert start["status"] == 200
+    assert app.got_first_request
+    assert b"The Musical Hop" in body["body"]
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+
+from conftest import add_venue, add_artist, add_show
+from booking import IntervalIndex, check_batch
+from models import Show
+
+
+def test_interval_index_finds_overlaps_only():
+    start = datetime(2030, 1, 1, 20)
+    index = IntervalIndex([(start, start + timedelta(hours=1), 1)])
+    assert index.conflict(start + timedelta(minutes=30), start + timedelta(hours=2)) == \
+        (start, start + timedelta(hours=1), 1)
+    # [start, end) intervals: back to back is not an overlap
+    assert index.conflict(start + timedelta(hours=1), start + timedelta(hours=2)) is None
+    assert index.conflict(start - timedelta(hours=1), start) is None
+
+
+def test_booking_form_rejects_a_double_booking(client):
+    venue, artist = add_venue(), add_artist()
+    start = (datetime.now() + timedelta(days=3)).replace(hour=20, minute=0, second=0, microsecond=0)
+    add_show(venue, artist, start)
+    other = add_venue(name="Park Square Live Music & Coffee")
+    response = client.post("/shows/create", data={
+        "artist_id": artist.id, "venue_id": other.id, "duration": 60,
+        "start_time": (start + timedelta(minutes=30)).strftime("%Y-%m-%d %H:%M:%S")}, follow_redirects=True)
+    assert "already booked" in response.get_data(as_text=True)
+    assert Show.query.count() == 1
+
+
+def test_booking_form_rejects_a_negative_duration(client):
+    venue, artist = add_venue(), add_artist()
+    start = datetime.now() + timedelta(days=3)
+    response = client.post("/shows/create", data={
+        "artist_id": artist.id, "venue_id": venue.id, "duration": -600,
+        "start_time": start.strftime("%Y-%m-%d %H:%M:%S")}, follow_redirects=True)
+    assert "Invalid duration" in response.get_data(as_text=True)
+    assert Show.query.count() == 0
+
+
+def test_check_batch_reports_each_row(app):
+    venue, artist = add_venue(), add_artist()
+    start = datetime.now() + timedelta(days=3)
+    add_show(venue, artist, start)
+    errors = check_batch([
+        (artist.id, venue.id, start + timedelta(minutes=10), start + timedelta(minutes=70)),
+        (artist.id, venue.id, start + timedelta(hours=2), start + timedelta(hours=3)),
+        (artist.id, venue.id, start + timedelta(hours=2, minutes=30), start + timedelta(hours=4)),
+        (artist.id, 404, start + timedelta(hours=5), start + timedelta(hours=6)),
+    ])
+    assert "already booked" in errors[0]
+    assert errors[1] is None
+    assert "row 2" in errors[2]
+    assert errors[3] == "venue 404 does not exist"
@@ -0,0 +1,59 @@
+import time
+from datetime import datetime, timedelta
+
+from conftest import add_venue, add_artist, add_show
+from models import db, RollupState
+from rollups import roll_forward
+
+
+def test_detail_page_answers_304_until_it_changes(client):
+    venue = add_venue()
+    first = client.get(f"/venues/{venue.id}")
+    assert first.status_code == 200
+    assert client.get(f"/venues/{venue.id}", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+
+    venue.name = "The Dueling Pianos Bar"
+    db.session.commit()
+    changed = client.get(f"/venues/{venue.id}", headers={"If-None-Match": first.headers["ETag"]})
+    assert changed.status_code == 200
+    assert "The Dueling Pianos Bar" in changed.get_data(as_text=True)
+
+
+def test_cached_detail_follows_a_show_moving_into_the_past(client):
+    venue, artist = add_venue(), add_artist()
+    add_show(venue, artist, datetime.now() + timedelta(seconds=1))
+    before = client.get(f"/venues/{venue.id}")
+    assert "1 Upcoming Show<" in before.get_data(as_text=True)
+
+    time.sleep(1.2)
+    after = client.get(f"/venues/{venue.id}", headers={"If-None-Match": before.headers["ETag"]})
+    assert after.status_code == 200
+    assert "1 Past Show<" in after.get_data(as_text=True)
+    # the new ETag now describes the new body
+    assert client.get(f"/venues/{venue.id}", headers={"If-None-Match": after.headers["ETag"]}).status_code == 304
+
+
+def test_listing_changes_version_on_roll_forward(client):
+    venue, artist = add_venue(), add_artist()
+    add_show(venue, artist, datetime.now() + timedelta(hours=1))
+    first = client.get("/venues")
+    roll_forward(datetime.now() + timedelta(hours=2))
+    assert RollupState.query.get(1).rolled_to > datetime.now()
+    assert client.get("/venues", headers={"If-None-Match": first.headers["ETag"]}).status_code == 200
+
+
+def test_missing_detail_page_is_404(client):
+    assert client.get("/venues/404").status_code == 404
+    assert client.get("/api/v1/artists/404").status_code == 404
+
+
+def test_feed_token_outlives_the_cache_ttl(app):
+    feed = app.extensions["recent_listings"]
+    app.config["CACHE_TTL"] = 0
+    try:
+        add_venue()
+        venues, _ = feed.listings()
+        generation = feed._generations[app]
+        assert feed.listings()[0] == venues and feed._generations[app] == generation
+    finally:
+        app.config["CACHE_TTL"] = 60
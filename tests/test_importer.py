@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta
+
+import pytest
+import sqlalchemy as sa
+
+from conftest import add_venue, add_artist
+from booking import booking_index
+from importer import allocate_ids, run_import
+from models import db, Venue
+
+
+def test_shows_import_reaches_the_workers_caches(client, tmp_path):
+    venue, artist = add_venue(), add_artist()
+    venue_id, artist_id = venue.id, artist.id
+    start = (datetime.now() + timedelta(days=3)).replace(microsecond=0)
+    assert booking_index.conflicts(venue_id, artist_id, start, start + timedelta(hours=1)) == []
+    assert "0 Upcoming Shows" in client.get(f"/venues/{venue_id}").get_data(as_text=True)
+
+    path = tmp_path / "shows.csv"
+    path.write_text(f"artist_id,venue_id,start_time\n{artist_id},{venue_id},{start.isoformat()}\n")
+    assert run_import("shows", str(path)) == (1, [])
+
+    assert [entity_type for entity_type, _ in
+            booking_index.conflicts(venue_id, artist_id, start, start + timedelta(hours=1))] == ["artist", "venue"]
+    assert "1 Upcoming Show<" in client.get(f"/venues/{venue_id}").get_data(as_text=True)
+
+
+def test_allocated_ids_hold_the_write_lock(app):
+    connection = db.session.connection()
+    assert allocate_ids(connection, Venue.__table__, 3) == [1, 2, 3]
+    other = sa.create_engine(app.config["SQLALCHEMY_DATABASE_URI"], connect_args={"timeout": 0})
+    with pytest.raises(sa.exc.OperationalError, match="locked"):
+        with other.begin() as writer:
+            writer.execute(sa.text("UPDATE venues SET name = name"))
+    db.session.rollback()
+    other.dispose()
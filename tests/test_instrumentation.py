@@ -0,0 +1,21 @@
+import logging
+
+from conftest import add_venue
+
+
+def request_lines(caplog):
+    return [record for record in caplog.records if record.getMessage().startswith('{"event": "request"')]
+
+
+def test_request_log_follows_its_own_setting(app, client, caplog, monkeypatch):
+    add_venue()
+    monkeypatch.setitem(app.config, "SQL_SAMPLE_RATE", 0)
+    monkeypatch.setattr(app, "debug", True)
+    with caplog.at_level(logging.INFO, logger=app.logger.name):
+        response = client.get("/venues/1")
+        assert "db;dur=" in response.headers["Server-Timing"]
+        assert request_lines(caplog) == []
+
+        monkeypatch.setitem(app.config, "SQL_LOG_ALL_REQUESTS", True)
+        client.get("/venues/1")
+        assert len(request_lines(caplog)) == 1
@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+
+from conftest import add_venue, add_artist, add_show
+from models import db, ShowCount
+from rollups import roll_forward, check
+
+
+def test_roll_forward_moves_started_shows_to_past(app):
+    venue, artist = add_venue(), add_artist()
+    now = datetime.now()
+    add_show(venue, artist, now + timedelta(hours=1))
+    add_show(venue, artist, now + timedelta(days=2))
+    assert ShowCount.lookup(ShowCount.VENUE, venue.id) == (2, 0)
+
+    assert roll_forward(now + timedelta(hours=2)) == 1
+    assert ShowCount.lookup(ShowCount.VENUE, venue.id) == (1, 1)
+    assert ShowCount.lookup(ShowCount.ARTIST, artist.id) == (1, 1)
+    # rolling to an earlier time is a no-op
+    assert roll_forward(now) == 0
+
+
+def test_check_reports_and_repairs_drift(app):
+    venue, artist = add_venue(), add_artist()
+    add_show(venue, artist, datetime.now() + timedelta(days=1))
+    db.session.query(ShowCount).filter(ShowCount.entity_type == ShowCount.VENUE).update({"upcoming": 7})
+    db.session.commit()
+
+    assert check() == [(ShowCount.VENUE, venue.id, (7, 0), (1, 0))]
+    check(repair=True)
+    assert check() == []
+    assert ShowCount.lookup(ShowCount.VENUE, venue.id) == (1, 0)
+
+
+def test_deleting_a_venue_takes_its_shows_off_the_artist(client):
+    venue, artist = add_venue(), add_artist()
+    add_show(venue, artist, datetime.now() + timedelta(days=1))
+    venue_id, artist_id = venue.id, artist.id
+    assert client.delete(f"/venues/{venue_id}").status_code == 302
+    assert ShowCount.lookup(ShowCount.ARTIST, artist_id) == (0, 0)
+    assert check() == []
+
+
+def test_retire_warns_when_workers_cannot_hear_of_it(app):
+    venue_id = add_venue().id
+    result = app.test_cli_runner().invoke(args=["retire", "venues", "--ids", str(venue_id)])
+    assert result.exit_code == 0, result.output
+    assert "Retired 1 venues." in result.output
+    assert "CACHE_BACKEND is not redis" in result.output
@@ -0,0 +1,64 @@
+import time
+
+import pytest
+from sqlalchemy.orm import Session
+
+from conftest import add_venue
+from models import db, Venue
+from routing import STICKY_SESSION_KEY
+
+
+@pytest.fixture
+def replicated(app, tmp_path):
+    # a replica that never catches up: writes only reach the primary file
+    app.config["SQLALCHEMY_BINDS"] = {"replica_0": f"sqlite:///{tmp_path / 'replica.db'}"}
+    replica = db.get_engine(app, bind="replica_0")
+    db.Model.metadata.create_all(replica)
+    yield app
+    db.session.remove()
+    db.Model.metadata.drop_all(replica)
+    app.config["SQLALCHEMY_BINDS"] = {}
+
+
+def fetch(client, path, **data):
+    # in its own app context, as in production, so `g` does not carry the
+    # replica choice from one request to the next
+    with client.application.app_context():
+        return client.post(path, data=data) if data else client.get(path)
+
+
+def sticky_client(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session[STICKY_SESSION_KEY] = time.time() + 60
+    return client
+
+
+def test_read_only_views_use_the_replica(replicated, client):
+    add_venue(name="Primary Only")
+    assert fetch(client, "/venues/1").status_code == 404
+    assert b"Primary Only" in fetch(sticky_client(replicated), "/venues/1").data
+
+
+def test_replica_reads_do_not_fill_shared_indexes(replicated, client):
+    add_venue(name="Fresh Venue")
+    # other clients fill the feed and the search indexes first
+    assert fetch(client, "/").status_code == 200
+    assert fetch(client, "/venues/search", search_term="Fresh").status_code == 200
+    assert fetch(client, "/autocomplete?q=fre").status_code == 200
+
+    writer = sticky_client(replicated)
+    assert b"Fresh Venue" in fetch(writer, "/").data
+    assert b"Fresh Venue" in fetch(writer, "/venues/search", search_term="Fresh").data
+    assert fetch(writer, "/autocomplete?q=fre&type=venue").json == {"venues": [{"id": 1, "name": "Fresh Venue"}]}
+
+
+def test_sticky_clients_bypass_the_view_cache(replicated, client):
+    with Session(db.get_engine(replicated, bind="replica_0")) as session:
+        session.add(Venue(name="Stale Name", city="San Francisco", state="CA", address="1015 Folsom Street",
+                          phone="123-123-1234"))
+        session.commit()
+    add_venue(name="Fresh Name")
+    assert b"Stale Name" in fetch(client, "/venues/1").data
+    page = fetch(sticky_client(replicated), "/venues/1").data
+    assert b"Fresh Name" in page and b"Stale Name" not in page
@@ -0,0 +1,65 @@
+import threading
+
+from conftest import add_venue
+from models import db, Venue
+from search import GENERATION_KEY
+
+
+def names(app, term):
+    return [match["name"] for match in app.extensions["name_search"].search(Venue, term)["data"]]
+
+
+def completions(app, prefix):
+    return [match["name"] for match in app.extensions["name_search"].autocomplete(Venue, prefix)]
+
+
+def test_writes_update_the_indexes_in_place(app):
+    name_search = app.extensions["name_search"]
+    add_venue(name="The Musical Hop")
+    assert names(app, "hop") == ["The Musical Hop"] and completions(app, "mus") == ["The Musical Hop"]
+    indexes = name_search.backend.indexes
+
+    venue = add_venue(name="Hop Scotch")
+    name_search.index(venue)
+    assert names(app, "hop") == ["Hop Scotch", "The Musical Hop"]
+    assert completions(app, "sco") == ["Hop Scotch"]
+    name_search.discard(Venue, venue.id)
+    assert names(app, "hop") == ["The Musical Hop"] and completions(app, "sco") == []
+    assert name_search.backend.indexes is indexes and not name_search._rebuilds
+
+
+def test_other_processes_writes_rebuild_in_the_background(app, monkeypatch):
+    name_search = app.extensions["name_search"]
+    add_venue(name="The Musical Hop")
+    assert names(app, "hop") == ["The Musical Hop"] and completions(app, "mus") == ["The Musical Hop"]
+    # holds the rebuild until the old indexes have answered
+    built = threading.Event()
+    rebuilt = name_search.backend.rebuilt
+    monkeypatch.setattr(name_search.backend, "rebuilt", lambda: built.wait(5) and rebuilt())
+
+    # another worker adds a venue and replaces the token
+    db.session.add(Venue(name="Hop Scotch", city="San Francisco", state="CA", address="1 Main Street",
+                         phone="123-123-1234"))
+    db.session.commit()
+    app.extensions["view_cache"].backend.set(GENERATION_KEY, "other", expire=False)
+
+    # answered from the current indexes while the new ones are built
+    assert names(app, "hop") == ["The Musical Hop"] and completions(app, "sco") == []
+    thread = name_search._rebuilds[app]["thread"]
+    built.set()
+    thread.join()
+    assert names(app, "hop") == ["Hop Scotch", "The Musical Hop"]
+    assert completions(app, "sco") == ["Hop Scotch"]
+
+
+def test_the_token_does_not_expire(app):
+    app.config["CACHE_TTL"] = 0
+    try:
+        add_venue(name="The Musical Hop")
+        indexes = app.extensions["name_search"].backend.indexes
+        assert names(app, "hop") == ["The Musical Hop"]
+        assert names(app, "hop") == ["The Musical Hop"]
+        assert not app.extensions["name_search"]._rebuilds
+        assert app.extensions["name_search"].backend.indexes is indexes
+    finally:
+        app.config["CACHE_TTL"] = 60